@@ -1,13 +1,220 @@
-from flask import Flask, jsonify, request
+import asyncio
 import json
-from main import simulate_combat
+import logging
+import math
+import os
+from concurrent.futures import Future, as_completed
+from typing import Optional
+from flask import Flask, Response, jsonify, request
+import instrumentation
+from simulate_combat import (
+    evaluate_matchup,
+    sampling_settings,
+    ENGINES,
+    EXACT_ENGINE,
+    MONTE_CARLO_ENGINE,
+)
 from combatants.unit import Unit
+from combat_result import MatchupResult
+from matchup_matrix import MatchupMatrix
+from job_queue import Job, JobQueue
+from matchup_pool import MatchupPool
+from melee import DEFAULT_MODELS, MAX_ROUNDS, simulate_melee
+from optimizer import rank_units, DEFAULT_LIMIT
+from sweep import run_sweep, SweepAxis, SWEEP_ENGINES
+from replay_log import ReplayLog
+from roster_loader import RosterValidationError
+from result_cache import ResultCache
+from result_store import (
+    ResultStore,
+    StoredMatchup,
+    DEFAULT_LIMIT as STORED_LIMIT,
+)
+from tournament import pairings, run_tournament
+from unit_registry import UnitRegistry
 
-# Assuming SAMPLESIZE and other related functions are defined elsewhere
-SAMPLESIZE = 10000
-TIE_THRESHOLD = 0.05  # 5% threshold for declaring a tie
+UNITS_PATH = "units.json"
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = None  # Seconds; None keeps results until evicted
+# Optional precomputed matrix written by main.py --matrix
+MATCHUP_MATRIX_PATH = os.environ.get("MONTEHAMMER_MATRIX")
+# SQLite database every evaluated matchup is written to; unset or empty
+# disables it, so importing the app never creates one by itself
+RESULT_STORE_PATH = os.environ.get("MONTEHAMMER_RESULTS_DB")
+# Log with the seed of every simulated matchup, for replay_log.py to
+# re-execute; unset or empty leaves evaluations unseeded and unlogged
+REPLAY_LOG_PATH = os.environ.get("MONTEHAMMER_REPLAY_LOG")
+MAX_BATCH_PAIRS = 1000
+MAX_SWEEP_POINTS = 1000
+# Bound on a side's models times wounds in /melee; the state it follows grows
+# with the product of both sides' wounds
+MAX_MELEE_WOUNDS = 200
+MAX_CONCURRENT_JOBS = int(os.environ.get("MONTEHAMMER_JOBS", 2))
+JOB_EVENTS_HEARTBEAT = 15  # Seconds between keep-alive events of a job stream
+# Instrument the roll pipeline of requests evaluated in the web process
+PROFILE = os.environ.get("MONTEHAMMER_PROFILE") == "1"
+# Serve /evaluate from an async view that awaits the shared process pool
+ASYNC_SERVING = os.environ.get("MONTEHAMMER_ASYNC") == "1"
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+# Built at import so gunicorn --preload parses the roster once for all workers
+unit_registry = UnitRegistry(UNITS_PATH)
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, UNITS_PATH)
+matchup_matrix = (
+    MatchupMatrix.load(MATCHUP_MATRIX_PATH) if MATCHUP_MATRIX_PATH else None
+)
+result_store = ResultStore(RESULT_STORE_PATH) if RESULT_STORE_PATH else None
+replay_log = ReplayLog(REPLAY_LOG_PATH) if REPLAY_LOG_PATH else None
+# Started on the first batch request, after gunicorn has forked its workers
+matchup_pool = MatchupPool(replay_log=replay_log)
+job_queue = JobQueue(MAX_CONCURRENT_JOBS)
+if PROFILE:
+    instrumentation.enable()
+
+
+def matrix_matchup(
+    attacker: Unit, target: Unit, engine: str
+) -> Optional[MatchupResult]:
+    """The matchup from the precomputed matrix, if it holds both units."""
+    if (
+        matchup_matrix is not None
+        and matchup_matrix.matches(engine)
+        and matchup_matrix.has_unit(attacker)
+        and matchup_matrix.has_unit(target)
+    ):
+        attacker_results = matchup_matrix.combat_result(
+            attacker.get_name(), target.get_name()
+        )
+        target_results = matchup_matrix.combat_result(
+            target.get_name(), attacker.get_name()
+        )
+        if attacker_results is not None and target_results is not None:
+            return MatchupResult(
+                attacker.get_name(),
+                attacker._points,
+                target.get_name(),
+                target._points,
+                attacker_results,
+                target_results,
+            )
+    return None
+
+
+def matchup_cache_key(attacker: Unit, target: Unit, engine: str) -> tuple[str, bool]:
+    """Key of a matchup in the result cache, and whether the matchup is the
+    reverse of the result cached under it. Units are keyed by their combat
+    signatures, so units that only differ in name and points share results,
+    and a matchup and its reverse share one result, cached with the unit of
+    the smaller signature digest as attacker."""
+    attacker_digest = ResultCache.make_key(attacker.combat_signature())
+    target_digest = ResultCache.make_key(target.combat_signature())
+    reversed_units = attacker_digest > target_digest
+    if reversed_units:
+        attacker_digest, target_digest = target_digest, attacker_digest
+    key = ResultCache.make_key(
+        attacker_digest, target_digest, engine, sampling_settings()
+    )
+    return key, reversed_units
+
+
+def oriented(
+    result: MatchupResult, reversed_units: bool, attacker: Unit, target: Unit
+) -> MatchupResult:
+    """A result cached under a matchup's key, turned round and named for
+    these units."""
+    if reversed_units:
+        result = result.reversed()
+    return result.renamed(
+        attacker.get_name(), attacker._points, target.get_name(), target._points
+    )
+
+
+def cache_matchup(
+    attacker: Unit, target: Unit, engine: str, result: MatchupResult
+) -> None:
+    cache_key, reversed_units = matchup_cache_key(attacker, target, engine)
+    result_cache.put(cache_key, result.reversed() if reversed_units else result)
+
+
+def submit_matchup(
+    cache_key: str, reversed_units: bool, attacker: Unit, target: Unit, engine: str
+) -> Future:
+    """Evaluate a matchup on the shared pool the way round it is cached, so
+    that it and its reverse share one evaluation."""
+    if reversed_units:
+        attacker, target = target, attacker
+    return matchup_pool.submit_shared(cache_key, attacker, target, engine)
+
+
+def cached_matchup(
+    attacker: Unit, target: Unit, engine: str
+) -> Optional[MatchupResult]:
+    """The cached result of an equivalent matchup or its reverse, named for
+    these units."""
+    cache_key, reversed_units = matchup_cache_key(attacker, target, engine)
+    result = result_cache.get(cache_key)
+    if result is None:
+        return None
+    return oriented(result, reversed_units, attacker, target)
+
+
+def known_matchup(attacker: Unit, target: Unit, engine: str) -> Optional[MatchupResult]:
+    """The result of a matchup from the precomputed matrix, the result cache or
+    the result store, without simulating it."""
+    result = matrix_matchup(attacker, target, engine)
+    if result is None:
+        result = cached_matchup(attacker, target, engine)
+    if result is None and result_store is not None:
+        result = result_store.get(attacker, target, engine)
+        if result is not None:
+            cache_matchup(attacker, target, engine, result)
+    return result
+
+
+def store_matchups(matchups: list[StoredMatchup]) -> None:
+    """Write newly evaluated matchups to the result store in one transaction."""
+    if result_store is not None and matchups:
+        result_store.put_many(matchups)
+
+
+def cached_evaluate_matchup(attacker: Unit, target: Unit, engine: str):
+    """evaluate_matchup behind the precomputed matrix, the result cache and
+    the result store."""
+    result = known_matchup(attacker, target, engine)
+    if result is None:
+        if replay_log is None:
+            result = evaluate_matchup(attacker, target, engine)
+        else:
+            result = replay_log.evaluate(attacker, target, engine)
+        cache_matchup(attacker, target, engine, result)
+        store_matchups([(attacker, target, engine, None, result)])
+    return result
+
+
+def matchup_response(result: MatchupResult, engine: str) -> dict:
+    """The JSON body describing one evaluated matchup."""
+    winner_name = result.get_winner()
+    if winner_name is None:
+        winner = "It's a TIE!"
+    else:
+        winner = f"{winner_name} WINS!"
+
+    interval = result.advantage_interval()
+    if interval is not None:
+        interval = [round(bound, 2) for bound in interval]
+
+    return {
+        "attacker": result.attacker_name,
+        "attacker_points": result.attacker_points,
+        "target": result.target_name,
+        "target_points": result.target_points,
+        "advantage_ratio": round(result.advantage_ratio, 2),
+        "winner": winner,
+        "engine": engine,
+        "samples": result.attacker_results.samples,
+        "advantage_interval": interval,
+    }
 
 
 @app.route("/")
@@ -26,59 +233,655 @@ def index():
     )
 
 
-@app.route("/evaluate", methods=["GET"])
-def evaluate_units():
+async def pooled_evaluate_matchup(
+    attacker: Unit, target: Unit, engine: str
+) -> MatchupResult:
+    """cached_evaluate_matchup with the simulation awaited on the shared
+    process pool. Concurrent requests for equivalent matchups share one."""
+    result = known_matchup(attacker, target, engine)
+    if result is None:
+        cache_key, reversed_units = matchup_cache_key(attacker, target, engine)
+        shared = await asyncio.wrap_future(
+            submit_matchup(cache_key, reversed_units, attacker, target, engine)
+        )
+        result_cache.put(cache_key, shared)
+        result = oriented(shared, reversed_units, attacker, target)
+        store_matchups([(attacker, target, engine, None, result)])
+    return result
 
-    # Load units from JSON file
-    with open("units.json", encoding="utf-8") as file:
-        units_data = json.load(file)
-        units = [Unit.from_json(unit_data) for unit_data in units_data["units"]]
 
-    # Create a dictionary for easy lookup by name
-    units_dict = {unit.get_name(): unit for unit in units}
+def evaluate_arguments():
+    """The attacker, target and engine of an /evaluate request, or an error."""
+    # Pick up edits to the roster file without a restart
+    unit_registry.refresh()
 
     # Get unit names from query parameters
     attacker_name = request.args.get("attacker")
     target_name = request.args.get("target")
+    engine = request.args.get("engine", MONTE_CARLO_ENGINE)
 
     # Check if both units exist
-    if attacker_name not in units_dict or target_name not in units_dict:
-        return jsonify({"error": "One or both units not found"}), 404
+    if attacker_name not in unit_registry or target_name not in unit_registry:
+        return None, (jsonify({"error": "One or both units not found"}), 404)
+
+    if engine not in ENGINES:
+        return None, (
+            jsonify({"error": f"Unknown engine, expected one of {ENGINES}"}),
+            400,
+        )
+
+    return (
+        unit_registry.get(attacker_name),
+        unit_registry.get(target_name),
+        engine,
+    ), None
+
 
-    attacker = units_dict[attacker_name]
-    target = units_dict[target_name]
+@app.route("/evaluate", methods=["GET"])
+def evaluate_units():
+    arguments, error = evaluate_arguments()
+    if error is not None:
+        return error
+    attacker, target, engine = arguments
 
     # Simulate combat between the units
-    attacker_results = simulate_combat(attacker, target)
-    attacker_efficiency = (
-        attacker_results.kill_rate * (target._points / attacker._points) * 100
+    result = cached_evaluate_matchup(attacker, target, engine)
+
+    # Return results as JSON
+    return jsonify(matchup_response(result, engine))
+
+
+async def evaluate_units_async():
+    """/evaluate with the simulation awaited on the shared process pool, so the
+    request holds no CPU while it waits and identical requests share it."""
+    arguments, error = evaluate_arguments()
+    if error is not None:
+        return error
+    attacker, target, engine = arguments
+
+    result = await pooled_evaluate_matchup(attacker, target, engine)
+    return jsonify(matchup_response(result, engine))
+
+
+# An async view costs a fresh event loop per request, so it is opt-in; the
+# profile keeps simulations in this process, where they are instrumented
+if ASYNC_SERVING and not PROFILE:
+    app.view_functions["evaluate_units"] = evaluate_units_async
+
+
+def parse_batch_pairs(body: dict) -> Optional[list[tuple[str, str]]]:
+    """The (attacker, target) names of a batch request body, either an explicit
+    "pairs" list or one "unit" against the rest of the roster."""
+    if "unit" in body:
+        name = body["unit"]
+        if not isinstance(name, str):
+            return None
+        return [(name, other) for other in unit_registry.names() if other != name]
+
+    pairs = body.get("pairs")
+    if not isinstance(pairs, list):
+        return None
+    parsed = []
+    for pair in pairs:
+        if (
+            not isinstance(pair, list)
+            or len(pair) != 2
+            or not all(isinstance(name, str) for name in pair)
+        ):
+            return None
+        parsed.append((pair[0], pair[1]))
+    return parsed
+
+
+@app.route("/evaluate/batch", methods=["POST"])
+def evaluate_batch():
+    """Evaluate many matchups in one request.
+
+    The body is {"pairs": [[attacker, target], ...]} or {"unit": name} for one
+    unit against the whole roster, with an optional "engine". A matchup and its
+    reverse are simulated once. With "stream": true (or ?stream=1) results are
+    sent as NDJSON lines as they finish, otherwise as one JSON list in request
+    order. A matchup whose evaluation fails gets a record with an "error" in
+    its place, and the rest of the batch is still answered."""
+    unit_registry.refresh()
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+
+    engine = body.get("engine", MONTE_CARLO_ENGINE)
+    if engine not in ENGINES:
+        return jsonify({"error": f"Unknown engine, expected one of {ENGINES}"}), 400
+
+    pairs = parse_batch_pairs(body)
+    if pairs is None:
+        return (
+            jsonify(
+                {"error": 'Expected "pairs" as [attacker, target] lists or "unit"'}
+            ),
+            400,
+        )
+    if len(pairs) > MAX_BATCH_PAIRS:
+        return jsonify({"error": f"At most {MAX_BATCH_PAIRS} pairs per batch"}), 400
+
+    missing = sorted(
+        {name for pair in pairs for name in pair} - set(unit_registry.names())
+    )
+    if missing:
+        return jsonify({"error": "Units not found", "missing": missing}), 404
+
+    # One simulated direction per unordered pair; the other is its reverse
+    matchups: dict[tuple[str, str], list[tuple[str, str]]] = {}
+    for attacker_name, target_name in pairs:
+        if (target_name, attacker_name) in matchups:
+            directions = matchups[(target_name, attacker_name)]
+        else:
+            directions = matchups.setdefault((attacker_name, target_name), [])
+        if (attacker_name, target_name) not in directions:
+            directions.append((attacker_name, target_name))
+
+    results: dict[tuple[str, str], MatchupResult] = {}
+    # Matchups of equivalent units, either way round, share one simulation
+    submitted: dict[str, Future] = {}
+    futures: dict[Future, list[tuple[str, str, bool]]] = {}
+    for attacker_name, target_name in matchups:
+        attacker = unit_registry.get(attacker_name)
+        target = unit_registry.get(target_name)
+        result = known_matchup(attacker, target, engine)
+        if result is not None:
+            results[(attacker_name, target_name)] = result
+            continue
+        cache_key, reversed_units = matchup_cache_key(attacker, target, engine)
+        if cache_key not in submitted:
+            submitted[cache_key] = submit_matchup(
+                cache_key, reversed_units, attacker, target, engine
+            )
+            futures[submitted[cache_key]] = []
+        futures[submitted[cache_key]].append(
+            (attacker_name, target_name, reversed_units)
+        )
+
+    def directed(key: tuple[str, str], result) -> list[dict]:
+        if isinstance(result, Exception):
+            return [
+                {
+                    "attacker": attacker_name,
+                    "target": target_name,
+                    "engine": engine,
+                    "error": f"Evaluation failed: {result}",
+                }
+                for attacker_name, target_name in matchups[key]
+            ]
+        return [
+            matchup_response(result if direction == key else result.reversed(), engine)
+            for direction in matchups[key]
+        ]
+
+    def finished():
+        """Canonical matchups with their results, cached ones first. A failed
+        evaluation yields its exception for its matchups instead, so the rest
+        of the batch is still answered."""
+        yield from results.items()
+        cache_keys = {future: key for key, future in submitted.items()}
+        evaluated = []
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                logger.exception("Batch evaluation failed")
+                for attacker_name, target_name, _ in futures[future]:
+                    yield (attacker_name, target_name), error
+                continue
+            result_cache.put(cache_keys[future], result)
+            for attacker_name, target_name, reversed_units in futures[future]:
+                attacker = unit_registry.get(attacker_name)
+                target = unit_registry.get(target_name)
+                renamed = oriented(result, reversed_units, attacker, target)
+                evaluated.append((attacker, target, engine, None, renamed))
+                yield (attacker_name, target_name), renamed
+        store_matchups(evaluated)
+
+    stream = body.get("stream", False) or request.args.get("stream") == "1"
+    if stream:
+
+        def lines():
+            for key, result in finished():
+                for response in directed(key, result):
+                    yield json.dumps(response) + "\n"
+
+        return Response(lines(), mimetype="application/x-ndjson")
+
+    responses = {}
+    for key, result in finished():
+        for response in directed(key, result):
+            responses[(response["attacker"], response["target"])] = response
+    return jsonify({"results": [responses[pair] for pair in pairs]})
+
+
+def matchup_job(attacker: Unit, target: Unit, engine: str):
+    def work(job: Job) -> dict:
+        result = known_matchup(attacker, target, engine)
+        if result is None:
+            cache_key, reversed_units = matchup_cache_key(attacker, target, engine)
+            shared = submit_matchup(
+                cache_key, reversed_units, attacker, target, engine
+            ).result()
+            result_cache.put(cache_key, shared)
+            result = oriented(shared, reversed_units, attacker, target)
+            store_matchups([(attacker, target, engine, None, result)])
+        job.advance()
+        return matchup_response(result, engine)
+
+    return work
+
+
+def tournament_job(units: list[Unit], engine: str, seed: Optional[int]):
+    def work(job: Job) -> list[dict]:
+        results = {}
+        # On the shared pool, so that concurrent jobs and batches divide the
+        # cores between them rather than each forking a pool of its own
+        for i, j, result in run_tournament(
+            units,
+            engine,
+            matchup_pool.workers,
+            seed,
+            executor=matchup_pool.executor if matchup_pool.workers > 1 else None,
+        ):
+            results[(i, j)] = result
+            job.advance()
+        store_matchups(
+            [
+                (units[i], units[j], engine, seed, result)
+                for (i, j), result in results.items()
+            ]
+        )
+        return [
+            matchup_response(results[pair], engine) for pair in pairings(len(units))
+        ]
+
+    return work
+
+
+@app.route("/optimize", methods=["POST"])
+def optimize():
+    """Rank roster units by points efficiency against opponents.
+
+    The body is {"target": name} or {"targets": [names]}, with an optional
+    points "budget", "engine" (default exact), "limit" and "candidates" (names,
+    default the whole roster)."""
+    unit_registry.refresh()
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+
+    engine = body.get("engine", EXACT_ENGINE)
+    if engine not in ENGINES:
+        return jsonify({"error": f"Unknown engine, expected one of {ENGINES}"}), 400
+
+    targets = body.get("targets", [body["target"]] if "target" in body else None)
+    candidates = body.get("candidates", unit_registry.names())
+    if not isinstance(targets, list) or not targets:
+        return jsonify({"error": 'Expected "target" or "targets"'}), 400
+    if not isinstance(candidates, list):
+        return jsonify({"error": '"candidates" must be a list of names'}), 400
+    names = targets + candidates
+    if not all(isinstance(name, str) for name in names):
+        return jsonify({"error": "Unit names must be strings"}), 400
+    missing = sorted(set(names) - set(unit_registry.names()))
+    if missing:
+        return jsonify({"error": "Units not found", "missing": missing}), 404
+
+    budget = body.get("budget")
+    limit = body.get("limit", DEFAULT_LIMIT)
+    if budget is not None and (not isinstance(budget, int) or budget <= 0):
+        return jsonify({"error": '"budget" must be a positive integer'}), 400
+    if not isinstance(limit, int) or limit <= 0:
+        return jsonify({"error": '"limit" must be a positive integer'}), 400
+
+    ranking = rank_units(
+        [unit_registry.get(name) for name in candidates],
+        [unit_registry.get(name) for name in targets],
+        budget,
+        engine,
+        limit,
     )
-    target_results = simulate_combat(target, attacker)
-    target_efficiency = (
-        target_results.kill_rate * (attacker._points / target._points) * 100
+    return jsonify({"engine": engine, "budget": budget, **ranking.to_json()})
+
+
+@app.route("/melee", methods=["GET"])
+def melee():
+    """Fight rounds of melee between ?attacker= and ?target= with optional
+    ?attacker_models=, ?target_models= and ?rounds=, and return the chances of
+    each outcome and the expected models left standing."""
+    unit_registry.refresh()
+
+    attacker_name = request.args.get("attacker")
+    target_name = request.args.get("target")
+    if attacker_name not in unit_registry or target_name not in unit_registry:
+        return jsonify({"error": "One or both units not found"}), 404
+    attacker = unit_registry.get(attacker_name)
+    target = unit_registry.get(target_name)
+
+    counts = {}
+    for name, default in (
+        ("attacker_models", DEFAULT_MODELS),
+        ("target_models", DEFAULT_MODELS),
+        ("rounds", MAX_ROUNDS),
+    ):
+        try:
+            counts[name] = int(request.args.get(name, default))
+        except ValueError:
+            counts[name] = 0
+        if counts[name] <= 0:
+            return jsonify({"error": f'"{name}" must be a positive integer'}), 400
+    for side, unit in (("attacker", attacker), ("target", target)):
+        if counts[f"{side}_models"] * unit._wounds > MAX_MELEE_WOUNDS:
+            return (
+                jsonify(
+                    {"error": f"At most {MAX_MELEE_WOUNDS} wounds on the {side}'s side"}
+                ),
+                400,
+            )
+
+    result = simulate_melee(
+        attacker,
+        target,
+        counts["attacker_models"],
+        counts["target_models"],
+        counts["rounds"],
+    )
+    return jsonify(
+        {
+            "attacker": attacker.get_name(),
+            "target": target.get_name(),
+            **counts,
+            **result.to_json(),
+        }
     )
-    advantage_ratio = attacker_efficiency / target_efficiency
 
-    # Determine winner
-    if abs(advantage_ratio - 1) <= TIE_THRESHOLD:
-        winner = "It's a TIE!"
-    elif advantage_ratio > 1:
-        winner = f"{attacker_name} WINS!"
+
+@app.route("/sweep", methods=["POST"])
+def sweep():
+    """What-if sweep of a matchup over fields of the units' definitions.
+
+    The body is {"attacker": ..., "target": ..., "vary": {"attacker.strength":
+    [3, 4, 5], ...}} with an optional "engine" (exact or vectorized), "seed"
+    and "format" (json, table or heatmap)."""
+    unit_registry.refresh()
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+
+    attacker_name = body.get("attacker")
+    target_name = body.get("target")
+    if attacker_name not in unit_registry or target_name not in unit_registry:
+        return jsonify({"error": "One or both units not found"}), 404
+
+    engine = body.get("engine", EXACT_ENGINE)
+    if engine not in SWEEP_ENGINES:
+        return (
+            jsonify({"error": f"Unknown engine, expected one of {SWEEP_ENGINES}"}),
+            400,
+        )
+    output = body.get("format", "json")
+    if output not in ("json", "table", "heatmap"):
+        return jsonify({"error": "Expected format json, table or heatmap"}), 400
+    seed = body.get("seed")
+    if seed is not None and not isinstance(seed, int):
+        return jsonify({"error": '"seed" must be an integer'}), 400
+
+    vary = body.get("vary")
+    if not isinstance(vary, dict) or not vary:
+        return jsonify({"error": 'Expected "vary" as {field: [values]}'}), 400
+    try:
+        axes = [SweepAxis.parse(field, values) for field, values in vary.items()]
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    if not all(isinstance(axis.values, list) for axis in axes):
+        return jsonify({"error": "Every varied field needs a list of values"}), 400
+    if output == "heatmap" and len(axes) > 2:
+        return jsonify({"error": "A heatmap shows at most two fields"}), 400
+    if math.prod(len(axis.values) for axis in axes) > MAX_SWEEP_POINTS:
+        return jsonify({"error": f"At most {MAX_SWEEP_POINTS} grid points"}), 400
+
+    try:
+        result = run_sweep(
+            unit_registry.get(attacker_name).get_definition(),
+            unit_registry.get(target_name).get_definition(),
+            axes,
+            engine,
+            workers=matchup_pool.workers,
+            seed=seed,
+            # Only started if the grid is split over more than one worker
+            executor=matchup_pool.executor if matchup_pool.workers > 1 else None,
+        )
+    except RosterValidationError as error:
+        # Varied values that do not make a valid unit definition
+        return jsonify({"error": "Invalid sweep", "errors": error.errors}), 400
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        return jsonify({"error": f"Invalid sweep: {error}"}), 400
+
+    if output == "table":
+        return Response(result.format_table() + "\n", mimetype="text/plain")
+    if output == "heatmap":
+        return Response(result.format_heatmap() + "\n", mimetype="text/plain")
+    return jsonify(result.to_json())
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Queue a long-running evaluation and return its id straight away.
+
+    The body is {"type": "matchup", "attacker": ..., "target": ...} or
+    {"type": "tournament"} with optional "units" (names, default the whole
+    roster) and "seed"; both take an optional "engine"."""
+    unit_registry.refresh()
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+
+    engine = body.get("engine", MONTE_CARLO_ENGINE)
+    if engine not in ENGINES:
+        return jsonify({"error": f"Unknown engine, expected one of {ENGINES}"}), 400
+
+    kind = body.get("type")
+    if kind == "matchup":
+        names = [body.get("attacker"), body.get("target")]
+    elif kind == "tournament":
+        names = body.get("units", unit_registry.names())
+        if not isinstance(names, list) or len(names) < 2:
+            return jsonify({"error": 'Expected at least two "units"'}), 400
     else:
-        winner = f"{target_name} WINS!"
+        return jsonify({"error": 'Expected "type" to be matchup or tournament'}), 400
 
-    # Return results as JSON
+    if not all(isinstance(name, str) for name in names):
+        return jsonify({"error": "Unit names must be strings"}), 400
+    missing = sorted(set(names) - set(unit_registry.names()))
+    if missing:
+        return jsonify({"error": "Units not found", "missing": missing}), 404
+    units = [unit_registry.get(name) for name in names]
+
+    if kind == "matchup":
+        job = job_queue.submit(kind, matchup_job(units[0], units[1], engine))
+    else:
+        seed = body.get("seed")
+        if seed is not None and not isinstance(seed, int):
+            return jsonify({"error": '"seed" must be an integer'}), 400
+        job = job_queue.submit(
+            kind, tournament_job(units, engine, seed), len(pairings(len(units)))
+        )
+
+    response = jsonify(job.snapshot())
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.snapshot())
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id: str):
+    """Server-sent events with the job's progress, ending with its result."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        version = -1
+        while True:
+            current = job.wait(version, JOB_EVENTS_HEARTBEAT)
+            if current == version and not job.is_finished():
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            state = job.snapshot(include_result=job.is_finished())
+            yield f"data: {json.dumps(state)}\n\n"
+            if job.is_finished():
+                return
+
+    return Response(events(), mimetype="text/event-stream")
+
+
+@app.route("/jobs/stats", methods=["GET"])
+def jobs_stats():
+    return jsonify(job_queue.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics of the result cache, the job queue and, with
+    MONTEHAMMER_PROFILE=1, the roll pipeline."""
+    cache = result_cache.stats()
+    jobs = job_queue.stats()
+    lines = []
+    for name, help_text, metric_type, value in (
+        ("hits_total", "Result cache hits.", "counter", cache["hits"]),
+        ("misses_total", "Result cache misses.", "counter", cache["misses"]),
+        (
+            "evictions_total",
+            "Result cache evictions.",
+            "counter",
+            cache["evictions"],
+        ),
+        ("size", "Results currently cached.", "gauge", cache["size"]),
+    ):
+        lines += instrumentation.prometheus_metric(
+            f"montehammer_result_cache_{name}", help_text, metric_type, [({}, value)]
+        )
+    lines += instrumentation.prometheus_metric(
+        "montehammer_jobs",
+        "Jobs known to the job queue by status.",
+        "gauge",
+        [
+            ({"status": status}, jobs[status])
+            for status in ("queued", "running", "done", "failed")
+        ],
+    )
+    pool = matchup_pool.stats()
+    for name, help_text, metric_type, value in (
+        (
+            "submitted_total",
+            "Matchups submitted to the process pool.",
+            "counter",
+            pool["submitted"],
+        ),
+        (
+            "coalesced_total",
+            "Matchup requests that shared an evaluation already in flight.",
+            "counter",
+            pool["coalesced"],
+        ),
+        (
+            "in_flight",
+            "Matchups being evaluated on the pool.",
+            "gauge",
+            pool["in_flight"],
+        ),
+    ):
+        lines += instrumentation.prometheus_metric(
+            f"montehammer_pool_{name}", help_text, metric_type, [({}, value)]
+        )
+    text = "\n".join(lines) + "\n" + instrumentation.render_prometheus()
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+
+def stored_unit_query():
+    """The unit, engine and limit of a result store query, or an error."""
+    if result_store is None:
+        return None, (jsonify({"error": "The result store is disabled"}), 404)
+    unit_registry.refresh()
+    unit = unit_registry.get(request.args.get("unit"))
+    if unit is None:
+        return None, (jsonify({"error": "Unit not found"}), 404)
+    engine = request.args.get("engine")
+    if engine is not None and engine not in ENGINES:
+        return None, (
+            jsonify({"error": f"Unknown engine, expected one of {ENGINES}"}),
+            400,
+        )
+    try:
+        limit = int(request.args.get("limit", STORED_LIMIT))
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        return None, (jsonify({"error": '"limit" must be a positive integer'}), 400)
+    return (unit, engine, limit), None
+
+
+@app.route("/results/wins", methods=["GET"])
+def stored_wins():
+    """Stored matchups the current definition of ?unit= wins, best first,
+    with optional ?engine= and ?limit=."""
+    query, error = stored_unit_query()
+    if error is not None:
+        return error
+    unit, engine, limit = query
+    return jsonify(
+        {
+            "unit": unit.get_name(),
+            "wins": [
+                matchup_response(result, result_engine)
+                for result_engine, result in result_store.wins(unit, limit, engine)
+            ],
+        }
+    )
+
+
+@app.route("/results/counters", methods=["GET"])
+def stored_counters():
+    """The units with the best mean stored advantage against ?unit=."""
+    query, error = stored_unit_query()
+    if error is not None:
+        return error
+    unit, engine, limit = query
     return jsonify(
         {
-            "attacker": attacker_name,
-            "attacker_points": attacker._points,
-            "target": target_name,
-            "target_points": target._points,
-            "advantage_ratio": round(advantage_ratio, 2),
-            "winner": winner,
+            "unit": unit.get_name(),
+            "counters": result_store.counters(unit, limit, engine),
         }
     )
 
 
+@app.route("/results/stats", methods=["GET"])
+def stored_stats():
+    if result_store is None:
+        return jsonify({"error": "The result store is disabled"}), 404
+    return jsonify(result_store.stats())
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
 if __name__ == "__main__":
     app.run()
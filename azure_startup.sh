@@ -1 +1 @@
-gunicorn --bind=0.0.0.0 --timeout 600 app:app
\ No newline at end of file
+gunicorn --bind=0.0.0.0 --timeout 600 --threads 8 --preload app:app
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""Benchmark harness for the combat simulation.
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --replay replay.jsonl
+    python benchmark.py compare baseline.json current.json --threshold 0.1
+
+run times simulate_combat for every ordered pairing of units.json with every
+engine, Unit.from_json and load_roster on a synthetic roster and end-to-end
+/evaluate requests through the Flask test client, all with fixed seeds. With
+--replay it also re-executes the entries of a replay log, and exits with status
+1 if any result differs from the logged one. compare exits with status 1 if any
+benchmark's median got slower by more than the threshold."""
+
+import argparse
+import copy
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable
+
+import dieroll
+from combatants.unit import Unit
+from dieroll import DiceRoller
+from replay_log import is_replayable, read_entries, replay, replay_entry
+from roster_loader import load_roster
+from simulate_combat import simulate_combat, ENGINES
+
+UNITS_PATH = "units.json"
+SEED = 20240101
+SYNTHETIC_ROSTER_SIZE = 1000
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(
+        len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+def measure(operations: list[Callable[[], object]], repeat: int) -> dict:
+    """Time every operation repeat times, then run them once more under
+    tracemalloc to find the peak memory, so tracing does not skew the timings."""
+    timings = []
+    for _ in range(repeat):
+        for operation in operations:
+            start = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for operation in operations:
+        operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "ops_per_sec": len(timings) / sum(timings),
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+def load_definitions() -> list[dict]:
+    with open(UNITS_PATH, encoding="utf-8") as file:
+        return json.load(file)["units"]
+
+
+def benchmark_simulate_combat(engine: str, repeat: int) -> dict:
+    units = [Unit.from_json(definition) for definition in load_definitions()]
+    operations = [
+        lambda attacker=attacker, target=target, seed=seed: simulate_combat(
+            attacker, target, engine, DiceRoller(seed)
+        )
+        for seed, (attacker, target) in enumerate(
+            (
+                (attacker, target)
+                for attacker in units
+                for target in units
+                if attacker is not target
+            ),
+            SEED,
+        )
+    ]
+    return measure(operations, repeat)
+
+
+def synthetic_roster() -> list[dict]:
+    """SYNTHETIC_ROSTER_SIZE renamed copies of the units in units.json."""
+    definitions = load_definitions()
+    roster = []
+    for i in range(SYNTHETIC_ROSTER_SIZE):
+        definition = copy.deepcopy(definitions[i % len(definitions)])
+        definition["name"] = f"{definition['name']} #{i}"
+        roster.append(definition)
+    return roster
+
+
+def benchmark_from_json(repeat: int) -> dict:
+    """Build the units of a synthetic roster with Unit.from_json; one
+    operation is one whole roster."""
+    roster = synthetic_roster()
+
+    def parse_roster():
+        return [Unit.from_json(definition) for definition in roster]
+
+    result = measure([parse_roster], repeat)
+    result["units_per_sec"] = result["ops_per_sec"] * SYNTHETIC_ROSTER_SIZE
+    return result
+
+
+def benchmark_load_roster(repeat: int) -> dict:
+    """Parse, validate and build a synthetic roster from its raw JSON bytes
+    with the roster loader; one operation is one whole roster."""
+    raw = json.dumps({"units": synthetic_roster()}).encode("utf-8")
+    result = measure([lambda: load_roster(raw)], repeat)
+    result["units_per_sec"] = result["ops_per_sec"] * SYNTHETIC_ROSTER_SIZE
+    return result
+
+
+def benchmark_replay(path: str, repeat: int) -> dict:
+    """Re-execute the replayable entries of a replay log; one operation is one
+    entry. Also counts the entries whose result differs from the logged one."""
+    entries = [entry for entry in read_entries(path) if is_replayable(entry)]
+    if not entries:
+        raise ValueError(f"No replayable entries in {path}")
+    units = {}
+    operations = [lambda entry=entry: replay_entry(entry, units) for entry in entries]
+    result = measure(operations, repeat)
+    result["mismatches"] = len(replay(entries)["mismatches"])
+    return result
+
+
+def benchmark_evaluate(engine: str, repeat: int, cached: bool) -> dict:
+    # Imported here so the other benchmarks do not need Flask
+    import app as web_app
+
+    # Results served from the store of earlier runs would skip the simulation
+    web_app.result_store = None
+    client = web_app.app.test_client()
+    names = web_app.unit_registry.names()
+
+    def request(attacker: str, target: str, seed: int):
+        if not cached:
+            web_app.result_cache.clear()
+        dieroll.seed(seed)
+        response = client.get(
+            "/evaluate",
+            query_string={"attacker": attacker, "target": target, "engine": engine},
+        )
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    operations = [
+        lambda attacker=attacker, target=target, seed=seed: request(
+            attacker, target, seed
+        )
+        for seed, (attacker, target) in enumerate(
+            (
+                (attacker, target)
+                for attacker in names
+                for target in names
+                if attacker != target
+            ),
+            SEED,
+        )
+    ]
+    return measure(operations, repeat)
+
+
+def run(args: argparse.Namespace) -> int:
+    benchmarks = {}
+    for engine in args.engines:
+        print(f"simulate_combat[{engine}]", file=sys.stderr)
+        benchmarks[f"simulate_combat[{engine}]"] = benchmark_simulate_combat(
+            engine, args.repeat
+        )
+    print("from_json", file=sys.stderr)
+    benchmarks[f"from_json[{SYNTHETIC_ROSTER_SIZE}]"] = benchmark_from_json(args.repeat)
+    print("load_roster", file=sys.stderr)
+    benchmarks[f"load_roster[{SYNTHETIC_ROSTER_SIZE}]"] = benchmark_load_roster(
+        args.repeat
+    )
+    for engine in args.engines:
+        print(f"evaluate[{engine}]", file=sys.stderr)
+        benchmarks[f"evaluate[{engine}]"] = benchmark_evaluate(
+            engine, args.repeat, cached=False
+        )
+        benchmarks[f"evaluate_cached[{engine}]"] = benchmark_evaluate(
+            engine, args.repeat, cached=True
+        )
+    if args.replay:
+        print("replay", file=sys.stderr)
+        benchmarks["replay"] = benchmark_replay(args.replay, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": SEED,
+            "repeat": args.repeat,
+        },
+        "benchmarks": benchmarks,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    for name, result in benchmarks.items():
+        print(
+            f"{name:32} {result['ops_per_sec']:12.1f} ops/s "
+            f"p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  "
+            f"peak {result['peak_memory_kib']:9.1f} KiB"
+        )
+    if benchmarks.get("replay", {}).get("mismatches"):
+        print(
+            f"{benchmarks['replay']['mismatches']} replayed results differ from "
+            f"{args.replay}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)["benchmarks"]
+    with open(args.current, encoding="utf-8") as file:
+        current = json.load(file)["benchmarks"]
+
+    regressions = 0
+    for name in sorted(baseline.keys() & current.keys()):
+        change = current[name]["p50_ms"] / baseline[name]["p50_ms"] - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            f"{name:32} p50 {baseline[name]['p50_ms']:9.3f} -> "
+            f"{current[name]['p50_ms']:9.3f} ms ({change:+.1%}){flag}"
+        )
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{name:32} missing from {args.current}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combat simulation benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument(
+        "--engines", nargs="+", choices=ENGINES, default=list(ENGINES)
+    )
+    run_parser.add_argument(
+        "--replay", default=None, help="replay log whose entries to re-execute"
+    )
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative p50 slowdown that counts as a regression",
+    )
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
@@ -1,4 +1,38 @@
+import math
+from typing import Iterable
+
+import numpy as np
+
+from confidence import ratio_interval
+
+COMBAT_RESULT_FIELDS = (
+    "hit_rate",
+    "raw_wound_rate",
+    "wound_rate",
+    "raw_unsaved_rate",
+    "unsaved_rate",
+    "raw_unwarded_rate",
+    "unwarded_rate",
+    "raw_unregenerated_rate",
+    "unregenerated_rate",
+    "kill_rate",
+)
+
+# One CombatResult per row of a structured array. Exact results store 0
+# samples and a NaN variance in place of None
+COMBAT_RESULT_DTYPE = np.dtype(
+    [(field, np.float64) for field in COMBAT_RESULT_FIELDS]
+    + [("samples", np.int64), ("kill_rate_log_variance", np.float64)]
+)
+
+
 class CombatResult:
+    __slots__ = COMBAT_RESULT_FIELDS + (
+        "samples",
+        "kill_rate_log_variance",
+        "distribution",
+    )
+
     def __init__(
         self,
         hit_rate,
@@ -11,6 +45,9 @@ class CombatResult:
         raw_unregenerated_rate,
         unregenerated_rate,
         kill_rate,
+        samples=None,
+        kill_rate_log_variance=None,
+        distribution=None,
     ):
         self.hit_rate = hit_rate
         self.raw_wound_rate = raw_wound_rate
@@ -22,3 +59,162 @@ class CombatResult:
         self.raw_unregenerated_rate = raw_unregenerated_rate
         self.unregenerated_rate = unregenerated_rate
         self.kill_rate = kill_rate
+        # Dice rolled per stage and the variance of log(kill_rate); both None
+        # for results that were calculated exactly
+        self.samples = samples
+        self.kill_rate_log_variance = kill_rate_log_variance
+        # CombatDistribution of wounds and kills, if it was asked for
+        self.distribution = distribution
+
+    def to_record(self) -> tuple:
+        """The result as a row of COMBAT_RESULT_DTYPE."""
+        return (
+            *[getattr(self, field) for field in COMBAT_RESULT_FIELDS],
+            0 if self.samples is None else self.samples,
+            (
+                np.nan
+                if self.kill_rate_log_variance is None
+                else self.kill_rate_log_variance
+            ),
+        )
+
+    @classmethod
+    def from_record(cls, record: np.void) -> "CombatResult":
+        """Rebuild a result from a row of COMBAT_RESULT_DTYPE."""
+        samples = int(record["samples"])
+        variance = float(record["kill_rate_log_variance"])
+        return cls(
+            *[float(record[field]) for field in COMBAT_RESULT_FIELDS],
+            samples or None,
+            None if np.isnan(variance) else variance,
+        )
+
+
+def combat_results_to_array(results: Iterable[CombatResult]) -> np.ndarray:
+    """Pack results into a structured array, one row per result."""
+    return np.array(
+        [result.to_record() for result in results], dtype=COMBAT_RESULT_DTYPE
+    )
+
+
+def combat_results_from_array(records: np.ndarray) -> list[CombatResult]:
+    return [CombatResult.from_record(record) for record in records]
+
+
+TIE_THRESHOLD = 0.05  # 5% threshold for declaring a tie
+
+
+def advantage_ratio(attacker_efficiency: float, target_efficiency: float) -> float:
+    """The attacker's efficiency over the target's. A side that cannot kill
+    at all against one that can gives 0 or inf, and two sides that both
+    cannot are a tie of 1."""
+    if target_efficiency == 0:
+        return 1.0 if attacker_efficiency == 0 else math.inf
+    return attacker_efficiency / target_efficiency
+
+
+class MatchupResult:
+    """Both directions of a pairing, weighed against each other by points."""
+
+    __slots__ = (
+        "attacker_name",
+        "attacker_points",
+        "target_name",
+        "target_points",
+        "attacker_results",
+        "target_results",
+        "attacker_efficiency",
+        "target_efficiency",
+        "advantage_ratio",
+    )
+
+    def __init__(
+        self,
+        attacker_name: str,
+        attacker_points: int,
+        target_name: str,
+        target_points: int,
+        attacker_results: CombatResult,
+        target_results: CombatResult,
+    ):
+        self.attacker_name = attacker_name
+        self.attacker_points = attacker_points
+        self.target_name = target_name
+        self.target_points = target_points
+        self.attacker_results = attacker_results
+        self.target_results = target_results
+
+        self.attacker_efficiency = (
+            attacker_results.kill_rate * (target_points / attacker_points) * 100
+        )
+        self.target_efficiency = (
+            target_results.kill_rate * (attacker_points / target_points) * 100
+        )
+        self.advantage_ratio = advantage_ratio(
+            self.attacker_efficiency, self.target_efficiency
+        )
+
+    def reversed(self) -> "MatchupResult":
+        """The same matchup seen from the target's side."""
+        return MatchupResult(
+            self.target_name,
+            self.target_points,
+            self.attacker_name,
+            self.attacker_points,
+            self.target_results,
+            self.attacker_results,
+        )
+
+    def renamed(
+        self,
+        attacker_name: str,
+        attacker_points: int,
+        target_name: str,
+        target_points: int,
+    ) -> "MatchupResult":
+        """The same combat results for another pair of units that fight
+        identically, weighed by their own points."""
+        return MatchupResult(
+            attacker_name,
+            attacker_points,
+            target_name,
+            target_points,
+            self.attacker_results,
+            self.target_results,
+        )
+
+    def advantage_interval(self):
+        """Confidence interval on advantage_ratio, or None for exact results."""
+        return ratio_interval(
+            self.advantage_ratio,
+            self.attacker_results.kill_rate_log_variance,
+            self.target_results.kill_rate_log_variance,
+        )
+
+    def is_settled(self) -> bool:
+        """Whether the confidence interval on advantage_ratio lies entirely on
+        one side of the tie threshold, so more samples cannot change the
+        verdict. Exact results are always settled."""
+        interval = self.advantage_interval()
+        if interval is None:
+            return (
+                self.attacker_results.samples is None
+                and self.target_results.samples is None
+            )
+        low, high = interval
+        return (
+            low > 1 + TIE_THRESHOLD
+            or high < 1 - TIE_THRESHOLD
+            or (low >= 1 - TIE_THRESHOLD and high <= 1 + TIE_THRESHOLD)
+        )
+
+    def is_tie(self) -> bool:
+        return abs(self.advantage_ratio - 1) <= TIE_THRESHOLD
+
+    def get_winner(self):
+        """Name of the winning unit, or None for a tie."""
+        if self.is_tie():
+            return None
+        if self.advantage_ratio > 1:
+            return self.attacker_name
+        return self.target_name
@@ -1,8 +1,12 @@
 """This module contains the Hit class, which is responsible for determining if
 an attacker hits a target."""
 
+from typing import Optional
+
+import numpy as np
+
 from combatants.combatant import Combatant
-from dieroll import rolld6
+from dieroll import DiceRoller, default_roller, DIE_FACES
 from strategies.roll_evaluation_strategy import RollEvaluationStrategy
 from rules.rule import RollModifierRule, RerollModifierRule, AutoSuccessModifierRule
 from rules.rule import HitRollModifier, HitRerollModifier, AutoHitModifier
@@ -72,30 +76,111 @@ class CombatantRollEvaluator:
             if isinstance(m, auto_success_modifier)
         ]
 
-    def evaluate_roll(self) -> bool:
+        # Whether each face of the die passes after the roll modifiers and
+        # the strategy, and whether it is rerolled if it fails, resolved once
+        # so that rolling only indexes into them
+        self._passes, self._rerolls = self._face_outcomes()
+        self._passes_by_face = (False, *self._passes)
+        self._rerolls_by_face = (False, *self._rerolls)
+        self._pass_table = np.array(self._passes_by_face, dtype=bool)
+        self._reroll_table = np.array(self._rerolls_by_face, dtype=bool)
+        self._auto_success_checks = [
+            modifier.compile_auto_success(attacker, target)
+            for modifier in self._auto_success_modifiers
+        ]
+
+    def evaluate_roll(self, rng: Optional[DiceRoller] = None) -> bool:
         """Determine if the attacker hits the target, applying modifiers
-        and allowing only one reroll."""
-        # Perform the roll, apply modifiers, and check for hit
-        roll = self._roll_and_apply_modifiers()
+        and allowing only one reroll. Dice are drawn from rng, or the default
+        roller if none is given."""
+        rng = rng or default_roller()
 
-        # Check for auto success
-        for auto_success_modifier in self._auto_success_modifiers:
-            if auto_success_modifier.is_auto_success(self._attacker, self._target):
+        face = rng.rolld6()
+
+        for auto_success in self._auto_success_checks:
+            if auto_success(rng):
                 return True
 
-        if self._strategy.evaluate_roll(self._attacker, self._target, roll):
+        if self._passes_by_face[face]:
             return True
 
         # If the initial roll failed, check if we should reroll
-        if self._should_reroll(roll):
-            roll = self._roll_and_apply_modifiers()
-            return self._strategy.evaluate_roll(self._attacker, self._target, roll)
+        if self._rerolls_by_face[face]:
+            return self._passes_by_face[rng.rolld6()]
 
         return False
 
-    def _roll_and_apply_modifiers(self) -> int:
-        """Roll the die and apply all roll modifiers."""
-        roll = rolld6()
+    def evaluate_rolls(
+        self, count: int, rng: Optional[DiceRoller] = None
+    ) -> np.ndarray:
+        """Evaluate count independent rolls at once, returning a boolean array
+        of successes. Rerolls are drawn only for the failed rolls that
+        qualify for one."""
+        rng = rng or default_roller()
+
+        successes = np.zeros(count, dtype=bool)
+        for auto_success_modifier in self._auto_success_modifiers:
+            successes |= auto_success_modifier.auto_successes(
+                count, self._attacker, self._target, rng
+            )
+
+        faces = rng.rolld6s(count)
+        successes |= self._pass_table[faces]
+
+        rerolls = ~successes & self._reroll_table[faces]
+        reroll_count = np.count_nonzero(rerolls)
+        if reroll_count:
+            successes[rerolls] = self._pass_table[rng.rolld6s(reroll_count)]
+
+        return successes
+
+    def success_probability(self) -> float:
+        """Exact probability that evaluate_roll succeeds, found by enumerating
+        the faces of the die and the reroll branch instead of sampling."""
+        no_auto_success = 1.0
+        for probability in self._auto_success_probabilities():
+            no_auto_success *= 1 - probability
+
+        passes, rerolls = self._passes, self._rerolls
+        single_roll_probability = sum(passes) / len(DIE_FACES)
+        roll_probability = (sum(passes) + sum(rerolls) * single_roll_probability) / len(
+            DIE_FACES
+        )
+
+        return 1 - no_auto_success + no_auto_success * roll_probability
+
+    def outcome_signature(self) -> tuple:
+        """The stage's class with whether each face passes, whether each
+        failed face is rerolled and the auto-success probabilities. These fix
+        the distribution of the stage's successes, so stages with equal
+        signatures can share their results whatever the units look like."""
+        return (
+            type(self).__name__,
+            self._passes,
+            self._rerolls,
+            self._auto_success_probabilities(),
+        )
+
+    def _face_outcomes(self) -> tuple[tuple[bool, ...], tuple[bool, ...]]:
+        rolls = [self._apply_modifiers(face) for face in DIE_FACES]
+        passes = tuple(
+            bool(self._strategy.evaluate_roll(self._attacker, self._target, roll))
+            for roll in rolls
+        )
+        rerolls = tuple(
+            not passed and self._should_reroll(roll)
+            for roll, passed in zip(rolls, passes)
+        )
+        return passes, rerolls
+
+    def _auto_success_probabilities(self) -> tuple[float, ...]:
+        return tuple(
+            modifier.auto_success_probability(self._attacker, self._target)
+            for modifier in self._auto_success_modifiers
+        )
+
+    def _apply_modifiers(self, roll: int) -> int:
+        """Apply all roll modifiers to a die result."""
         for modifier in self._roll_modifiers:
             roll = modifier.modify_roll(roll, self._attacker, self._target)
         return roll
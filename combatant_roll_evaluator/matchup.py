@@ -0,0 +1,91 @@
+"""This module contains the CompiledMatchup class, which resolves everything the
+roll pipeline needs for one attacker/target pairing once, up front."""
+
+import threading
+from collections import OrderedDict
+
+from combatants.combatant import Combatant
+from combatant_roll_evaluator.combatant_roll_evaluator import (
+    Hit,
+    HitWound,
+    ArmourSave,
+    WardSave,
+    RegenerationSave,
+)
+
+STAGES = (Hit, HitWound, ArmourSave, WardSave, RegenerationSave)
+
+MATCHUP_CACHE_SIZE = 4096
+
+# Compiled matchups keyed by the combat signatures of attacker and target,
+# least recently used first
+_compiled: OrderedDict[tuple, "CompiledMatchup"] = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+class CompiledMatchup:
+    """The roll evaluators of every stage for an attacker striking a target.
+
+    Each evaluator has already resolved, for every face of the die, whether it
+    passes and whether it is rerolled, so simulations only index into those
+    tables. Units are treated as immutable once compiled; build a new Unit
+    rather than adding modifiers to one that has been simulated. A compiled
+    matchup is shared by all units with the same combat signatures, so its
+    attacker and target are the first such pair that was compiled."""
+
+    def __init__(self, attacker: Combatant, target: Combatant):
+        self.attacker = attacker
+        self.target = target
+        self.stages = tuple(stage(attacker, target) for stage in STAGES)
+        (
+            self.hit,
+            self.wound,
+            self.armour_save,
+            self.ward_save,
+            self.regeneration_save,
+        ) = self.stages
+
+        self._wound_probability = None
+
+    def __repr__(self) -> str:
+        return f"CompiledMatchup({self.attacker!r}, {self.target!r})"
+
+    def wound_probability(self) -> float:
+        """Exact chance that one attack passes every stage and causes a wound."""
+        if self._wound_probability is None:
+            probability = 1.0
+            for stage in self.stages:
+                probability *= stage.success_probability()
+            self._wound_probability = probability
+        return self._wound_probability
+
+    def reverse(self) -> "CompiledMatchup":
+        """The compiled matchup with attacker and target swapped."""
+        return compile_matchup(self.target, self.attacker)
+
+
+def compile_matchup(attacker: Combatant, target: Combatant) -> CompiledMatchup:
+    """Compile the matchup for an attacker striking a target, reusing the
+    compiled matchup of earlier calls for units with the same combat
+    signatures. The least recently used matchup is dropped once
+    MATCHUP_CACHE_SIZE are cached.
+
+    The cache is keyed on the signatures rather than the units, so units that
+    are rebuilt, by a roster reload or per sweep point, reuse the compiled
+    matchup of an equivalent pair instead of each being kept alive by an
+    entry of their own."""
+    key = (attacker.combat_signature(), target.combat_signature())
+    with _compiled_lock:
+        matchup = _compiled.get(key)
+        if matchup is not None:
+            _compiled.move_to_end(key)
+            return matchup
+    # Compiled outside the lock; a thread that compiled the same pair first
+    # wins, so every caller shares one matchup
+    compiled = CompiledMatchup(attacker, target)
+    with _compiled_lock:
+        matchup = _compiled.setdefault(key, compiled)
+        _compiled.move_to_end(key)
+        while len(_compiled) > MATCHUP_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return matchup
@@ -5,6 +5,8 @@ from rules.modifier import Modifier
 
 
 class Combatant(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def get_weapon_skill(self) -> int:
         pass
@@ -1,11 +1,43 @@
-import importlib
+import hashlib
+import json
 from typing import List, Optional, Any
+
+import numpy as np
+
 from combatants.combatant import Combatant
 from strategies.roll_evaluation_strategy import RollEvaluationStrategy
-from rules.modifier import Modifier
+from rules.modifier import Modifier, signature_value
+
+# Profile values stored on every unit, in the order of Unit.stats()
+STAT_FIELDS = (
+    "weapon_skill",
+    "ballistic_skill",
+    "strength",
+    "toughness",
+    "wounds",
+    "initiative",
+    "attacks",
+    "points",
+)
 
 
 class Unit(Combatant):
+    __slots__ = (
+        "_hit_strategy",
+        "_wound_strategy",
+        "_save_strategy",
+        "_regeneration_strategy",
+        "_ward_strategy",
+        "_defensive_modifiers",
+        "_offensive_modifiers",
+        "_name",
+        *(f"_{field}" for field in STAT_FIELDS),
+        "_definition",
+        "_definition_hash",
+        "_combat_signature",
+        "_extra",
+    )
+
     def __init__(
         self,
         **kwargs,  # Capture additional attributes
@@ -26,10 +58,28 @@ class Unit(Combatant):
         self._initiative: Optional[int] = None
         self._attacks: Optional[int] = None
         self._wounds: Optional[int] = None
+        self._points: Optional[int] = None
+        self._definition: Optional[dict] = None
+        self._definition_hash: Optional[str] = None
+        self._combat_signature: Optional[tuple] = None
+        # Attributes outside the fixed schema, read through __getattr__
+        self._extra: dict[str, Any] = {}
 
         # Dynamically add any additional attributes from kwargs with underscore prefix
         for key, value in kwargs.items():
-            setattr(self, f"_{key}", value)
+            if f"_{key}" in _SLOTS:
+                setattr(self, f"_{key}", value)
+            else:
+                self._extra[f"_{key}"] = value
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for names that are not slots
+        if name != "_extra":
+            try:
+                return self._extra[name]
+            except KeyError:
+                pass
+        raise AttributeError(f"'Unit' object has no attribute {name!r}")
 
     def __repr__(self) -> str:
         return f"Unit({self._name})"
@@ -59,28 +109,95 @@ class Unit(Combatant):
     def get_attacks(self) -> Optional[int]:
         return self._attacks
 
+    def stats(self) -> np.ndarray:
+        """The profile as a small int array in STAT_FIELDS order, with -1 for
+        values that are not set."""
+        return np.array(
+            [
+                -1 if value is None else value
+                for value in (getattr(self, f"_{field}") for field in STAT_FIELDS)
+            ],
+            dtype=np.int16,
+        )
+
+    def get_definition(self) -> Optional[dict]:
+        """The JSON definition this unit was created from, if any."""
+        return self._definition
+
+    def get_definition_hash(self) -> Optional[str]:
+        """SHA-256 of the normalized JSON definition, independent of key order."""
+        if self._definition_hash is None and self._definition is not None:
+            self._definition_hash = definition_hash(self._definition)
+        return self._definition_hash
+
+    def combat_signature(self) -> tuple:
+        """Everything about this unit that can change a combat result: the
+        profile without name and points, strategies, modifiers in the order
+        they apply and any attributes outside the schema. Units with equal
+        signatures fight identically."""
+        if self._combat_signature is None:
+            self._combat_signature = (
+                self.profile_signature(),
+                tuple(
+                    strategy.signature() if strategy is not None else None
+                    for strategy in (
+                        self._hit_strategy,
+                        self._wound_strategy,
+                        self._save_strategy,
+                        self._ward_strategy,
+                        self._regeneration_strategy,
+                    )
+                ),
+                tuple(modifier.signature() for modifier in self._offensive_modifiers),
+                tuple(modifier.signature() for modifier in self._defensive_modifiers),
+            )
+        return self._combat_signature
+
+    def profile_signature(self) -> tuple:
+        """The profile without name and points, plus any attributes outside
+        the schema, as the first part of combat_signature."""
+        return (
+            tuple(
+                (field, getattr(self, f"_{field}"))
+                for field in STAT_FIELDS
+                if field != "points"
+            ),
+            tuple(
+                sorted(
+                    (name, signature_value(value))
+                    for name, value in self._extra.items()
+                )
+            ),
+        )
+
     def calculate_damage(self, other_unit: "Unit") -> Any:
         """Calculate the damage this unit would deal to another unit using its strategy."""
         return self._hit_strategy.calculate_damage(self, other_unit)
 
     def set_hit_strategy(self, hit_strategy: RollEvaluationStrategy) -> None:
         self._hit_strategy = hit_strategy
+        self._combat_signature = None
 
     def set_wound_strategy(self, wound_strategy: RollEvaluationStrategy) -> None:
         self._wound_strategy = wound_strategy
+        self._combat_signature = None
 
     def set_save_strategy(self, save_strategy: RollEvaluationStrategy) -> None:
         self._save_strategy = save_strategy
+        self._combat_signature = None
 
     def set_ward_strategy(self, ward_strategy: RollEvaluationStrategy) -> None:
         self._ward_strategy = ward_strategy
+        self._combat_signature = None
 
     def set_regeneration_strategy(
         self, regeneration_strategy: RollEvaluationStrategy
     ) -> None:
         self._regeneration_strategy = regeneration_strategy
+        self._combat_signature = None
 
     def add_defensive_modifier(self, modifier: Modifier) -> None:
+        self._combat_signature = None
         if self._defensive_modifiers is None:
             self._defensive_modifiers = []
         self._defensive_modifiers.append(modifier)
@@ -89,6 +206,7 @@ class Unit(Combatant):
         return self._defensive_modifiers
 
     def add_offensive_modifier(self, modifier: Modifier) -> None:
+        self._combat_signature = None
         if self._offensive_modifiers is None:
             self._offensive_modifiers = []
         self._offensive_modifiers.append(modifier)
@@ -98,73 +216,18 @@ class Unit(Combatant):
 
     @staticmethod
     def from_json(data: dict) -> "Unit":
-        """Factory method to create a Unit from JSON data dynamically."""
+        """Factory method to create a Unit from JSON data; data is not modified."""
+        # Imported here because the roster loader builds on this module
+        from roster_loader import unit_from_definition
+
+        return unit_from_definition(data)
+
+
+# Set of the slots of Unit, for looking up keyword arguments in __init__
+_SLOTS = frozenset(Unit.__slots__)
 
-        def load_class(module_name: str, class_name: str) -> Any:
-            """Dynamically load a class from a string."""
-            try:
-                module = importlib.import_module(f"strategies.{module_name}")
-            except ModuleNotFoundError:
-                module = importlib.import_module(f"rules.{module_name}")
-            return getattr(module, class_name)
-
-        # Handle special cases: hit_strategy and modifiers
-        hit_strategy_class_name = data.pop("hit_strategy", "DefaultHitStrategy")
-        hit_strategy = load_class("hit_strategy", hit_strategy_class_name)()
-        wound_strategy_class_name = data.pop("wound_strategy", "DefaultWoundStrategy")
-        wound_strategy = load_class("wound_strategy", wound_strategy_class_name)()
-        save_strategy_class_name = data.pop("save_strategy", "DefaultSaveStrategy")
-        save_strategy = load_class("save_strategy", save_strategy_class_name)()
-        ward_strategy_class_name = data.pop("ward_strategy", "DefaultWardStrategy")
-        ward_strategy = load_class("ward_strategy", ward_strategy_class_name)()
-        regeneration_strategy_class_name = data.pop(
-            "save_strategy", "DefaultRegenerationStrategy"
-        )
-        regeneration_strategy = load_class(
-            "regeneration_strategy", regeneration_strategy_class_name
-        )()
-
-        defensiveModifiers = []
-        for modifier_data in data.pop("defensiveModifiers", []):
-            if isinstance(modifier_data, dict):
-                # Assume the dict contains the class name and its parameters
-                class_name = modifier_data.pop("class")
-                modifier_class = load_class("rule", class_name)
-                # Initialize with additional parameters
-                modifier_instance = modifier_class(**modifier_data)
-            else:
-                # Just the class name with no additional parameters
-                modifier_class = load_class("rule", modifier_data)
-                modifier_instance = modifier_class()
-            defensiveModifiers.append(modifier_instance)
-
-        offensiveModifiers = []
-        for modifier_data in data.pop("offensiveModifiers", []):
-            if isinstance(modifier_data, dict):
-                # Assume the dict contains the class name and its parameters
-                class_name = modifier_data.pop("class")
-                modifier_class = load_class("rule", class_name)
-                # Initialize with additional parameters
-                modifier_instance = modifier_class(**modifier_data)
-            else:
-                # Just the class name with no additional parameters
-                modifier_class = load_class("rule", modifier_data)
-                modifier_instance = modifier_class()
-            offensiveModifiers.append(modifier_instance)
-
-        # Create and return the Unit instance
-        unit = Unit(
-            **data,  # Pass the remaining attributes dynamically with underscore prefix
-        )
 
-        unit.set_hit_strategy(hit_strategy)
-        unit.set_wound_strategy(wound_strategy)
-        unit.set_save_strategy(save_strategy)
-        unit.set_ward_strategy(ward_strategy)
-        unit.set_regeneration_strategy(regeneration_strategy)
-        for modifier in defensiveModifiers:
-            unit.add_defensive_modifier(modifier)
-        for modifier in offensiveModifiers:
-            unit.add_offensive_modifier(modifier)
-
-        return unit
+def definition_hash(definition: dict) -> str:
+    """SHA-256 of a unit definition serialized with sorted keys."""
+    normalized = json.dumps(definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
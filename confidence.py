@@ -0,0 +1,45 @@
+"""This module contains the confidence interval helpers used to decide when a
+sampled simulation has rolled enough dice."""
+
+import math
+from typing import Optional, Sequence
+
+CONFIDENCE_Z = 1.96  # Two-sided 95% interval
+
+
+def wilson_half_width(successes: int, samples: int, z: float = CONFIDENCE_Z) -> float:
+    """Half-width of the Wilson score interval of a success rate."""
+    if samples == 0:
+        return 1.0
+    rate = successes / samples
+    spread = rate * (1 - rate) / samples + z * z / (4 * samples * samples)
+    return z * math.sqrt(spread) / (1 + z * z / samples)
+
+
+def log_product_variance(successes: Sequence[int], samples: int) -> float:
+    """Delta-method variance of the log of a product of independent success
+    rates, as in kill_rate being the product of all stage rates.
+
+    Rates are shrunk towards one half by half a success so that stages that
+    never succeeded yet still have a finite variance."""
+    variance = 0.0
+    for count in successes:
+        rate = (count + 0.5) / (samples + 1)
+        variance += (1 - rate) / (samples * rate)
+    return variance
+
+
+def ratio_interval(
+    ratio: float,
+    numerator_log_variance: Optional[float],
+    denominator_log_variance: Optional[float],
+    z: float = CONFIDENCE_Z,
+) -> Optional[tuple[float, float]]:
+    """Interval on a ratio of two independently estimated products, or None if
+    either side is exact or the ratio is degenerate."""
+    if numerator_log_variance is None or denominator_log_variance is None:
+        return None
+    if not 0 < ratio < math.inf:
+        return None
+    spread = z * math.sqrt(numerator_log_variance + denominator_log_variance)
+    return ratio * math.exp(-spread), ratio * math.exp(spread)
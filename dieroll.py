@@ -1,5 +1,151 @@
-from random import randint
+import os
+import threading
+from typing import Optional, Union
 
+import numpy as np
 
-def rolld6():
-    return randint(1, 6)
+DIE_FACES = range(1, 7)
+
+# Dice drawn from the generator at once to serve single rolls
+BUFFER_SIZE = 4096
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+class DiceRoller:
+    """Seedable source of dice backed by a NumPy Generator.
+
+    Single dice are served from a buffer drawn in bulk, so rolld6 costs little
+    more than a list pop. spawn() derives independent substreams, for example
+    one per parallel worker. A roller must not be shared between threads."""
+
+    def __init__(self, seed: Seed = None, buffer_size: int = BUFFER_SIZE):
+        if isinstance(seed, np.random.SeedSequence):
+            self._seed_sequence = seed
+        else:
+            self._seed_sequence = np.random.SeedSequence(seed)
+        self._generator = np.random.Generator(np.random.PCG64(self._seed_sequence))
+        self._buffer_size = buffer_size
+        self._buffer: list[int] = []
+
+    @property
+    def seed_sequence(self) -> np.random.SeedSequence:
+        return self._seed_sequence
+
+    def spawn(self, count: int) -> list["DiceRoller"]:
+        """Independent child rollers, reproducible from this roller's seed."""
+        return [
+            DiceRoller(child, self._buffer_size)
+            for child in self._seed_sequence.spawn(count)
+        ]
+
+    def rolld6(self) -> int:
+        if not self._buffer:
+            self._buffer = self._generator.integers(
+                1, 7, size=self._buffer_size
+            ).tolist()
+        return self._buffer.pop()
+
+    def rolld6s(self, count: int) -> np.ndarray:
+        """Roll count dice at once."""
+        return self._generator.integers(1, 7, size=count)
+
+    def randint(self, low: int, high: int) -> int:
+        """Draw an integer between low and high inclusive. Ranges within a d6
+        are served from the buffered dice by rejection."""
+        if 1 <= low <= high <= 6:
+            roll = self.rolld6()
+            while roll < low or roll > high:
+                roll = self.rolld6()
+            return roll
+        return int(self._generator.integers(low, high + 1))
+
+    def randints(self, low: int, high: int, count: int) -> np.ndarray:
+        """Draw count integers between low and high inclusive."""
+        return self._generator.integers(low, high + 1, size=count)
+
+
+class PrefetchedRoller:
+    """A view of a DiceRoller whose rolld6s calls are served from one batch of
+    dice drawn up front, for a caller that knows roughly how many it needs.
+
+    Once the batch runs out, and for every other kind of roll, the dice come
+    from the underlying roller. It is meant for a single call, so the batch is
+    never shared between threads."""
+
+    def __init__(self, rng: DiceRoller, count: int):
+        self._rng = rng
+        self._dice = rng.rolld6s(count)
+        self._position = 0
+
+    def rolld6s(self, count: int) -> np.ndarray:
+        end = self._position + count
+        if end > len(self._dice):
+            return self._rng.rolld6s(count)
+        dice = self._dice[self._position : end]
+        self._position = end
+        return dice
+
+    def __getattr__(self, name: str):
+        return getattr(self._rng, name)
+
+
+# The process-wide seed every thread's default roller is spawned from, and
+# how often it was replaced, so threads notice that their roller is stale
+_default_seed = np.random.SeedSequence()
+_default_generation = 0
+_default_lock = threading.Lock()
+_thread_rollers = threading.local()
+
+
+def default_roller() -> DiceRoller:
+    """This thread's roller, used when no roller is passed explicitly.
+
+    A DiceRoller must not be shared between threads, so every thread draws
+    from its own substream of the process-wide seed."""
+    if getattr(_thread_rollers, "generation", None) != _default_generation:
+        with _default_lock:
+            (child,) = _default_seed.spawn(1)
+            _thread_rollers.roller = DiceRoller(child)
+            _thread_rollers.generation = _default_generation
+    return _thread_rollers.roller
+
+
+def seed(value: Seed) -> None:
+    """Reseed the process-wide roller. The thread that calls this and then
+    rolls gets the same dice for the same seed every time."""
+    global _default_seed, _default_generation
+    with _default_lock:
+        if isinstance(value, np.random.SeedSequence):
+            _default_seed = value
+        else:
+            _default_seed = np.random.SeedSequence(value)
+        _default_generation += 1
+
+
+def _reseed_after_fork() -> None:
+    global _default_lock
+    # Another thread of the parent may have held the lock while forking
+    _default_lock = threading.Lock()
+    seed(None)
+
+
+# A forked process, such as a gunicorn worker of a preloaded app, would
+# otherwise roll the same dice as its parent and its siblings
+os.register_at_fork(after_in_child=_reseed_after_fork)
+
+
+def rolld6(rng: Optional[DiceRoller] = None) -> int:
+    return (rng or default_roller()).rolld6()
+
+
+def rolld6s(count: int, rng: Optional[DiceRoller] = None) -> np.ndarray:
+    """Roll count dice at once."""
+    return (rng or default_roller()).rolld6s(count)
+
+
+def randints(
+    low: int, high: int, count: int, rng: Optional[DiceRoller] = None
+) -> np.ndarray:
+    """Draw count integers between low and high inclusive, like randint."""
+    return (rng or default_roller()).randints(low, high, count)
@@ -0,0 +1,109 @@
+"""This module contains the CountDistribution and CombatDistribution classes,
+which describe the full spread of wounds and casualties of one round of attacks
+rather than only their expected values."""
+
+from typing import Sequence
+
+import numpy as np
+
+from combat_result import CombatResult
+
+
+def convolve_attacks(probabilities: Sequence[float]) -> np.ndarray:
+    """Distribution of the number of successes of independent attacks that
+    each succeed with the given probability, by convolving them one at a time."""
+    pmf = np.ones(1)
+    for probability in probabilities:
+        pmf = np.convolve(pmf, [1 - probability, probability])
+    return pmf
+
+
+class CountDistribution:
+    """Probability of every count 0..n. The tail sums are precomputed, so
+    at_least and at_most are single lookups."""
+
+    def __init__(self, pmf: np.ndarray):
+        self.pmf = np.asarray(pmf, dtype=float)
+        self._at_least = np.cumsum(self.pmf[::-1])[::-1]
+
+    def __len__(self) -> int:
+        return len(self.pmf)
+
+    def probability(self, count: int) -> float:
+        """Chance of exactly count."""
+        if 0 <= count < len(self.pmf):
+            return float(self.pmf[count])
+        return 0.0
+
+    def at_least(self, count: int) -> float:
+        """Chance of count or more."""
+        if count <= 0:
+            return 1.0
+        if count >= len(self.pmf):
+            return 0.0
+        return float(self._at_least[count])
+
+    def at_most(self, count: int) -> float:
+        """Chance of count or fewer."""
+        return 1.0 - self.at_least(count + 1)
+
+    def mean(self) -> float:
+        return float(np.dot(np.arange(len(self.pmf)), self.pmf))
+
+    def percentile(self, fraction: float) -> int:
+        """Smallest count whose cumulative probability reaches fraction."""
+        cumulative = 1.0 - self._at_least + self.pmf
+        return int(min(np.searchsorted(cumulative, fraction), len(self.pmf) - 1))
+
+    def grouped(self, size: int) -> "CountDistribution":
+        """Distribution of count // size, such as models removed when every
+        model takes size wounds and wounds carry over between models."""
+        counts = np.arange(len(self.pmf)) // size
+        return CountDistribution(np.bincount(counts, weights=self.pmf))
+
+    def to_json(self) -> list[float]:
+        return self.pmf.tolist()
+
+
+class CombatDistribution:
+    """Distributions of the unsaved wounds, the wounds that get through every
+    save, and the models killed by all of an attacker's attacks."""
+
+    def __init__(
+        self,
+        unsaved_wounds: CountDistribution,
+        wounds: CountDistribution,
+        models_killed: CountDistribution,
+    ):
+        self.unsaved_wounds = unsaved_wounds
+        self.wounds = wounds
+        self.models_killed = models_killed
+
+    @classmethod
+    def from_result(
+        cls, result: CombatResult, attacks: int, wounds_per_model: int
+    ) -> "CombatDistribution":
+        """Spread the per-attack stage probabilities of a result over attacks
+        independent attacks against models of wounds_per_model wounds."""
+        hit_probability = result.hit_rate / attacks if attacks else 0.0
+        unsaved_probability = (
+            hit_probability * result.raw_wound_rate * result.raw_unsaved_rate
+        )
+        wound_probability = (
+            unsaved_probability
+            * result.raw_unwarded_rate
+            * result.raw_unregenerated_rate
+        )
+        wounds = CountDistribution(convolve_attacks([wound_probability] * attacks))
+        return cls(
+            CountDistribution(convolve_attacks([unsaved_probability] * attacks)),
+            wounds,
+            wounds.grouped(wounds_per_model),
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "unsaved_wounds": self.unsaved_wounds.to_json(),
+            "wounds": self.wounds.to_json(),
+            "models_killed": self.models_killed.to_json(),
+        }
@@ -0,0 +1,238 @@
+"""This module contains the optional instrumentation of the roll pipeline, which
+counts and times stage evaluators, rules, strategies and dice per matchup.
+
+Instrumentation works by wrapping the pipeline's methods when enable() is
+called and restoring the originals on disable(), so it costs nothing at all
+while it is off. Times are inclusive: a stage's time contains the time of the
+rules and dice it calls."""
+
+import functools
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from combatant_roll_evaluator.combatant_roll_evaluator import CombatantRollEvaluator
+from combatant_roll_evaluator.matchup import STAGES, CompiledMatchup
+from dieroll import DiceRoller, PrefetchedRoller
+from rules.rule import Rule
+from strategies.roll_evaluation_strategy import RollEvaluationStrategy
+
+STAGE_METHODS = ("evaluate_roll", "evaluate_rolls", "success_probability")
+RULE_METHODS = (
+    "modify_roll",
+    "should_reroll",
+    "is_auto_success",
+    "auto_successes",
+    "auto_success_probability",
+    "get_modifier",
+)
+STRATEGY_METHODS = ("evaluate_roll", "get_target_number")
+DICE_METHODS = ("rolld6", "rolld6s", "randint", "randints")
+
+# (kind, name, matchup) -> [calls, nanoseconds]
+_metrics: dict[tuple[str, str, str], list[int]] = {}
+_metrics_lock = threading.Lock()
+# (class, method name, original attribute) of every wrapped method
+_originals: list[tuple[type, str, Callable]] = []
+# The matchup whose stage is running on this thread, for attributing rules
+_current = threading.local()
+
+
+def is_enabled() -> bool:
+    return bool(_originals)
+
+
+def enable() -> None:
+    """Start counting and timing the roll pipeline."""
+    if _originals:
+        return
+    for stage in STAGES:
+        _wrap(stage, "__init__", _stage_wrapper, "construct")
+    for name in STAGE_METHODS:
+        _wrap(CombatantRollEvaluator, name, _stage_wrapper, "stage")
+    _wrap(CompiledMatchup, "__init__", _matchup_wrapper, "compile")
+    for cls in _subclasses(Rule):
+        for name in RULE_METHODS:
+            _wrap(cls, name, _call_wrapper, "rule")
+    for cls in _subclasses(RollEvaluationStrategy):
+        for name in STRATEGY_METHODS:
+            _wrap(cls, name, _call_wrapper, "strategy")
+    for cls in (DiceRoller, PrefetchedRoller):
+        for name in DICE_METHODS:
+            _wrap(cls, name, _call_wrapper, "dice")
+
+
+def disable() -> None:
+    """Restore the uninstrumented methods; collected metrics are kept."""
+    while _originals:
+        cls, name, original = _originals.pop()
+        setattr(cls, name, original)
+
+
+def reset() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def snapshot(by_matchup: bool = True) -> list[dict]:
+    """Every metric collected so far, slowest first. Without by_matchup the
+    metrics of all matchups are added up."""
+    with _metrics_lock:
+        items = [(key, list(value)) for key, value in _metrics.items()]
+    if not by_matchup:
+        totals: dict[tuple[str, str, str], list[int]] = {}
+        for (kind, name, _), (calls, nanoseconds) in items:
+            total = totals.setdefault((kind, name, ""), [0, 0])
+            total[0] += calls
+            total[1] += nanoseconds
+        items = list(totals.items())
+    return sorted(
+        (
+            {
+                "kind": kind,
+                "name": name,
+                "matchup": matchup,
+                "calls": calls,
+                "seconds": nanoseconds / 1e9,
+            }
+            for (kind, name, matchup), (calls, nanoseconds) in items
+        ),
+        key=lambda metric: metric["seconds"],
+        reverse=True,
+    )
+
+
+def format_report(by_matchup: bool = False, limit: Optional[int] = None) -> str:
+    """The collected metrics as a plain text table."""
+    lines = [f"{'kind':10} {'name':44} {'calls':>10} {'seconds':>10}  matchup"]
+    for metric in snapshot(by_matchup)[:limit]:
+        lines.append(
+            f"{metric['kind']:10} {metric['name']:44} {metric['calls']:10d} "
+            f"{metric['seconds']:10.4f}  {metric['matchup']}"
+        )
+    return "\n".join(lines)
+
+
+def prometheus_metric(
+    name: str,
+    help_text: str,
+    metric_type: str,
+    samples: Iterable[tuple[dict, float]],
+) -> list[str]:
+    """Lines of one metric in the Prometheus text exposition format. Counter
+    names should end in _total, as the format expects."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = ",".join(
+            f'{key}="{_escape_label(str(label))}"' for key, label in labels.items()
+        )
+        lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """The pipeline metrics of all matchups added up; a label per matchup
+    would give every pair of units ever evaluated its own time series."""
+    metrics = snapshot(by_matchup=False)
+    labels = [{"kind": metric["kind"], "name": metric["name"]} for metric in metrics]
+    lines = prometheus_metric(
+        "montehammer_pipeline_calls_total",
+        "Instrumented calls of the roll pipeline.",
+        "counter",
+        zip(labels, [metric["calls"] for metric in metrics]),
+    ) + prometheus_metric(
+        "montehammer_pipeline_seconds_total",
+        "Inclusive time spent in instrumented calls of the roll pipeline.",
+        "counter",
+        zip(labels, [metric["seconds"] for metric in metrics]),
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _subclasses(cls: type) -> list[type]:
+    found = [cls]
+    for subclass in cls.__subclasses__():
+        found.extend(_subclasses(subclass))
+    return found
+
+
+def _wrap(cls: type, name: str, wrapper: Callable, kind: str) -> None:
+    # Only wrap methods a class defines itself, so inherited ones are timed once
+    original = cls.__dict__.get(name)
+    if original is None or isinstance(original, (staticmethod, classmethod)):
+        return
+    setattr(cls, name, wrapper(original, kind, name))
+    _originals.append((cls, name, original))
+
+
+def _record(key: tuple[str, str, str], nanoseconds: int) -> None:
+    # The increments are read-modify-writes, so they are made under the lock
+    # too or calls on other threads would be lost
+    with _metrics_lock:
+        metric = _metrics.setdefault(key, [0, 0])
+        metric[0] += 1
+        metric[1] += nanoseconds
+
+
+def _matchup_label(attacker, target) -> str:
+    return f"{attacker.get_name()} vs {target.get_name()}"
+
+
+def _stage_wrapper(method: Callable, kind: str, name: str) -> Callable:
+    @functools.wraps(method)
+    def instrumented(self, *args, **kwargs):
+        if kind == "construct":
+            matchup = _matchup_label(args[0], args[1])
+        else:
+            matchup = _matchup_label(self._attacker, self._target)
+        outer = getattr(_current, "matchup", "")
+        _current.matchup = matchup
+        start = time.perf_counter_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _record(
+                (kind, f"{type(self).__name__}.{name}", matchup),
+                time.perf_counter_ns() - start,
+            )
+            _current.matchup = outer
+
+    return instrumented
+
+
+def _matchup_wrapper(method: Callable, kind: str, name: str) -> Callable:
+    @functools.wraps(method)
+    def instrumented(self, attacker, target):
+        start = time.perf_counter_ns()
+        try:
+            return method(self, attacker, target)
+        finally:
+            _record(
+                (kind, type(self).__name__, _matchup_label(attacker, target)),
+                time.perf_counter_ns() - start,
+            )
+
+    return instrumented
+
+
+def _call_wrapper(method: Callable, kind: str, name: str) -> Callable:
+    @functools.wraps(method)
+    def instrumented(self, *args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _record(
+                (
+                    kind,
+                    f"{type(self).__name__}.{name}",
+                    getattr(_current, "matchup", ""),
+                ),
+                time.perf_counter_ns() - start,
+            )
+
+    return instrumented
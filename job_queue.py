@@ -0,0 +1,157 @@
+"""This module contains the JobQueue class, which runs long simulations in the
+background so that web requests only submit work and poll for its progress."""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+MAX_CONCURRENT_JOBS = 2
+MAX_FINISHED_JOBS = 256
+
+
+class Job:
+    """A unit of background work with progress that can be polled or waited on.
+
+    Every change bumps version, so a subscriber can wait for the next change
+    after the last version it has seen."""
+
+    def __init__(self, kind: str, total: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.completed = 0
+        self.total = total
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def advance(self, steps: int = 1) -> None:
+        """Record progress from inside the running work."""
+        with self._changed:
+            self.completed += steps
+            self._bump()
+
+    def snapshot(self, include_result: bool = True) -> dict:
+        """The job's state as a JSON-serialisable dict."""
+        with self._changed:
+            state = {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "completed": self.completed,
+                "total": self.total,
+                "version": self.version,
+                "created": self.created,
+                "finished": self.finished,
+            }
+            if self.status == FAILED:
+                state["error"] = self.error
+            if self.status == DONE and include_result:
+                state["result"] = self.result
+            return state
+
+    def wait(self, version: int, timeout: Optional[float] = None) -> int:
+        """Block until the job changed past version or the timeout expired, and
+        return the current version."""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.version > version or self.is_finished(), timeout
+            )
+            return self.version
+
+    def _set_status(
+        self, status: str, result: Any = None, error: Optional[str] = None
+    ) -> None:
+        with self._changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            if self.is_finished():
+                self.finished = time.time()
+            self._bump()
+
+    def _bump(self) -> None:
+        self.version += 1
+        self._changed.notify_all()
+
+
+class JobQueue:
+    """Runs submitted jobs on at most max_workers background threads.
+
+    The threads only orchestrate; CPU-heavy work is expected to be handed to a
+    process pool, so the cap limits how many heavy jobs run at once without
+    tying up the threads that serve requests. Threads are started on the first
+    submission, so a preloading server can fork before any exist. Finished jobs
+    are kept for polling until more than max_finished of them have piled up."""
+
+    def __init__(
+        self,
+        max_workers: int = MAX_CONCURRENT_JOBS,
+        max_finished: int = MAX_FINISHED_JOBS,
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._max_workers = max_workers
+        self._max_finished = max_finished
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, work: Callable[[Job], Any], total: int = 1) -> Job:
+        """Queue work(job), whose return value becomes the job's result."""
+        job = Job(kind, total)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "max_workers": self._max_workers,
+            **{
+                status: statuses.count(status)
+                for status in (QUEUED, RUNNING, DONE, FAILED)
+            },
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+
+    def _run(self, job: Job, work: Callable[[Job], Any]) -> None:
+        job._set_status(RUNNING)
+        try:
+            result = work(job)
+        except Exception as error:
+            logger.exception("Job %s failed", job.id)
+            job._set_status(FAILED, error=str(error))
+        else:
+            job._set_status(DONE, result=result)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished()]
+        for job_id in finished[: max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
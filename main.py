@@ -1,82 +1,137 @@
-import json
-from combatants.unit import Unit
-from simulate_combat import simulate_combat
+import argparse
+import os
+
+import instrumentation
+from combat_result import CombatResult, MatchupResult
+from matchup_matrix import MatchupMatrix
+from result_store import ResultStore
+from unit_registry import UnitRegistry
+from simulate_combat import ENGINES, MONTE_CARLO_ENGINE
+from tournament import pairings, run_tournament
+
+
+def print_combat_results(
+    attacker_name: str, target_name: str, results: CombatResult
+) -> None:
+    print(f"{attacker_name} attacking {target_name}:")
+    print(f"  Hit Rate          : {results.hit_rate:.2f}")
+    print(
+        f"  Wound Rate        : {results.wound_rate:.2f} (Raw: {results.raw_wound_rate:.2f})"
+    )
+    print(
+        f"  Unsaved Rate      : {results.unsaved_rate:.2f} (Raw: {results.raw_unsaved_rate:.2f})"
+    )
+    print(
+        f"  Unwarded Rate     : {results.unwarded_rate:.2f} (Raw: {results.raw_unwarded_rate:.2f})"
+    )
+    print(
+        f"  Unregenerated Rate: {results.unregenerated_rate:.2f} (Raw: {results.raw_unregenerated_rate:.2f})"
+    )
+
+
+def print_matchup(result: MatchupResult) -> None:
+    # Determine the winner with a tie threshold
+    winner_name = result.get_winner()
+    if winner_name is None:
+        winner = "🤝 It's a TIE! 🤝"
+    else:
+        winner = f"🏆 {winner_name} WINS! 🏆"
+
+    # Print results for both combat scenarios
+    print(f"\n{'='*60}")
+    print(f"Combat Simulation: {result.attacker_name} vs {result.target_name}")
+    print(f"{'-'*60}")
+    print_combat_results(
+        result.attacker_name, result.target_name, result.attacker_results
+    )
+    print(f"{'-'*60}")
+    print_combat_results(
+        result.target_name, result.attacker_name, result.target_results
+    )
+    print(
+        f"Advantage {result.attacker_name} ({result.attacker_points} points) vs. {result.target_name} ({result.target_points} points): {result.advantage_ratio:.1f}"
+    )
+    print(f"{'-'*60}")
+    print(f"{winner.center(58)}")
+    print(f"{'='*60}\n")
 
-TIE_THRESHOLD = 0.05
 
 if __name__ == "__main__":
-    with open("units.json", encoding="utf-8") as file:
-        data = json.load(file)
-        units = [Unit.from_json(unit_data) for unit_data in data["units"]]
+    parser = argparse.ArgumentParser(description="Round-robin combat evaluation")
+    parser.add_argument("--engine", choices=ENGINES, default=MONTE_CARLO_ENGINE)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes to spread pairings over (default: all CPU cores)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="seed for reproducible results"
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=None, help="pairings per work unit"
+    )
+    parser.add_argument(
+        "--matrix", default=None, help="also write all results to this .npz file"
+    )
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="reuse unchanged pairings from this .npz matrix and write all "
+        "results back to it",
+    )
+    parser.add_argument(
+        "--results-db",
+        default=None,
+        help="also add all results to this SQLite result store",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="count and time every stage, rule and die; runs in one process",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        # Metrics are collected per process, so keep every pairing in this one
+        args.workers = 1
+        instrumentation.enable()
+
+    units = UnitRegistry("units.json").units()
+    store = None
+    if args.store and os.path.exists(args.store):
+        # Read into memory, as the file is overwritten with the new results
+        store = MatchupMatrix.load(args.store, mmap=False)
 
     for unit in units:
         print(unit)
 
-    for i, attacker in enumerate(units):
-        for j, target in enumerate(units):
-            if i < j:  # Ensure each pairing is only considered once
-                # Simulate combat with attacker attacking target
-                attacker_results = simulate_combat(attacker, target)
-                attacker_efficiency = (
-                    attacker_results.kill_rate
-                    * (target._points / attacker._points)
-                    * 100
-                )
-
-                # Simulate combat with target attacking attacker
-                target_results = simulate_combat(target, attacker)
-                target_efficiency = (
-                    target_results.kill_rate * (attacker._points / target._points) * 100
-                )
+    # Results stream in as they finish; print them in pairing order so the
+    # output matches a serial run
+    order = pairings(len(units))
+    pending = {}
+    next_index = 0
+    results = []
+    for i, j, result in run_tournament(
+        units, args.engine, args.workers, args.seed, args.chunksize, store=store
+    ):
+        results.append((i, j, result))
+        pending[(i, j)] = result
+        while next_index < len(order) and order[next_index] in pending:
+            print_matchup(pending.pop(order[next_index]))
+            next_index += 1
 
-                advantage_ratio = attacker_efficiency / target_efficiency
+    if args.matrix or args.store:
+        matrix = MatchupMatrix.from_tournament(units, results, args.engine, args.seed)
+        for path in {args.matrix, args.store} - {None}:
+            matrix.save(path)
 
-                # Determine the winner with a tie threshold
-                if abs(advantage_ratio - 1) <= TIE_THRESHOLD:
-                    winner = "🤝 It's a TIE! 🤝"
-                elif advantage_ratio > 1:
-                    winner = f"🏆 {attacker.get_name()} WINS! 🏆"
-                else:
-                    winner = f"🏆 {target.get_name()} WINS! 🏆"
+    if args.results_db:
+        ResultStore(args.results_db).put_many(
+            (units[i], units[j], args.engine, args.seed, result)
+            for i, j, result in results
+        )
 
-                # Print results for both combat scenarios
-                print(f"\n{'='*60}")
-                print(
-                    f"Combat Simulation: {attacker.get_name()} vs {target.get_name()}"
-                )
-                print(f"{'-'*60}")
-                print(f"{attacker.get_name()} attacking {target.get_name()}:")
-                print(f"  Hit Rate          : {attacker_results.hit_rate:.2f}")
-                print(
-                    f"  Wound Rate        : {attacker_results.wound_rate:.2f} (Raw: {attacker_results.raw_wound_rate:.2f})"
-                )
-                print(
-                    f"  Unsaved Rate      : {attacker_results.unsaved_rate:.2f} (Raw: {attacker_results.raw_unsaved_rate:.2f})"
-                )
-                print(
-                    f"  Unwarded Rate     : {attacker_results.unwarded_rate:.2f} (Raw: {attacker_results.raw_unwarded_rate:.2f})"
-                )
-                print(
-                    f"  Unregenerated Rate: {attacker_results.unregenerated_rate:.2f} (Raw: {attacker_results.raw_unregenerated_rate:.2f})"
-                )
-                print(f"{'-'*60}")
-                print(f"{target.get_name()} attacking {attacker.get_name()}:")
-                print(f"  Hit Rate          : {target_results.hit_rate:.2f}")
-                print(
-                    f"  Wound Rate        : {target_results.wound_rate:.2f} (Raw: {target_results.raw_wound_rate:.2f})"
-                )
-                print(
-                    f"  Unsaved Rate      : {target_results.unsaved_rate:.2f} (Raw: {target_results.raw_unsaved_rate:.2f})"
-                )
-                print(
-                    f"  Unwarded Rate     : {target_results.unwarded_rate:.2f} (Raw: {target_results.raw_unwarded_rate:.2f})"
-                )
-                print(
-                    f"  Unregenerated Rate: {target_results.unregenerated_rate:.2f} (Raw: {target_results.raw_unregenerated_rate:.2f})"
-                )
-                print(
-                    f"Advantage {attacker.get_name()} ({attacker._points} points) vs. {target.get_name()} ({target._points} points): {advantage_ratio:.1f}"
-                )
-                print(f"{'-'*60}")
-                print(f"{winner.center(58)}")
-                print(f"{'='*60}\n")
+    if args.profile:
+        instrumentation.disable()
+        print(instrumentation.format_report())
@@ -0,0 +1,226 @@
+"""This module contains the MatchupMatrix class, an all-pairs table of combat
+results that is saved as an uncompressed .npz bundle and memory-mapped on load."""
+
+import struct
+import zipfile
+from typing import Iterable, Optional
+
+import numpy as np
+
+from combat_result import COMBAT_RESULT_DTYPE, CombatResult, MatchupResult
+from combatants.unit import Unit
+from simulate_combat import ENGINE_VERSION, settings_digest
+
+MATRIX_FIELDS = COMBAT_RESULT_DTYPE.names + ("advantage_ratio",)
+
+# Size of the fixed part of a zip local file header, followed by the member
+# name and the extra field whose lengths are stored at offset 26
+_LOCAL_HEADER_SIZE = 30
+
+
+class MatchupMatrix:
+    """n x n arrays indexed [attacker, target], one per CombatResult field plus
+    advantage_ratio, together with the unit index they refer to.
+
+    Pairings that were not evaluated, such as a unit against itself, are NaN,
+    or 0 in the samples array."""
+
+    def __init__(
+        self,
+        names: np.ndarray,
+        points: np.ndarray,
+        hashes: np.ndarray,
+        arrays: dict[str, np.ndarray],
+        engine: str = "",
+        seed: str = "",
+        version: int = 0,
+        settings: str = "",
+    ):
+        self.names = names
+        self.points = points
+        self.hashes = hashes
+        self.arrays = arrays
+        self.engine = engine
+        # The tournament seed as a string, empty if it was unseeded
+        self.seed = seed
+        # ENGINE_VERSION and settings_digest() of the run, 0 and empty for
+        # bundles written before they were stored
+        self.version = version
+        self.settings = settings
+        self._index = {str(name): i for i, name in enumerate(names)}
+        self._hash_index = {str(value): i for i, value in enumerate(hashes) if value}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def matches(self, engine: str, seed: Optional[int] = None) -> bool:
+        """Whether the results were evaluated with this engine and seed by the
+        current engine version and sampling settings."""
+        return (
+            self.engine == engine
+            and self.seed == ("" if seed is None else str(seed))
+            and self.version == ENGINE_VERSION
+            and self.settings == settings_digest()
+        )
+
+    @classmethod
+    def from_tournament(
+        cls,
+        units: list[Unit],
+        results: Iterable[tuple[int, int, MatchupResult]],
+        engine: str = "",
+        seed: Optional[int] = None,
+    ) -> "MatchupMatrix":
+        """Build the matrix from the (i, j, result) tuples of run_tournament."""
+        size = len(units)
+        records = np.zeros((size, size), dtype=COMBAT_RESULT_DTYPE)
+        for field in COMBAT_RESULT_DTYPE.names:
+            if field != "samples":
+                records[field] = np.nan
+        advantage_ratio = np.full((size, size), np.nan)
+        for i, j, result in results:
+            records[i, j] = result.attacker_results.to_record()
+            records[j, i] = result.target_results.to_record()
+            advantage_ratio[i, j] = result.advantage_ratio
+            advantage_ratio[j, i] = result.reversed().advantage_ratio
+
+        # Stored as one array per field so that each can be mapped on its own
+        arrays = {field: records[field].copy() for field in COMBAT_RESULT_DTYPE.names}
+        arrays["advantage_ratio"] = advantage_ratio
+        return cls(
+            np.array([unit.get_name() for unit in units], dtype=str),
+            np.array([unit._points for unit in units], dtype=np.int64),
+            np.array([unit.get_definition_hash() or "" for unit in units], dtype=str),
+            arrays,
+            engine,
+            "" if seed is None else str(seed),
+            ENGINE_VERSION,
+            settings_digest(),
+        )
+
+    def save(self, path: str) -> None:
+        """Write the matrix as an uncompressed .npz so it can be memory-mapped."""
+        np.savez(
+            path,
+            names=self.names,
+            points=self.points,
+            hashes=self.hashes,
+            engine=np.array(self.engine),
+            seed=np.array(self.seed),
+            version=np.array(self.version),
+            settings=np.array(self.settings),
+            **self.arrays,
+        )
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "MatchupMatrix":
+        """Read a matrix written by save, memory-mapping the field arrays."""
+        with zipfile.ZipFile(path) as bundle:
+            members = {name[: -len(".npy")]: name for name in bundle.namelist()}
+            # Bundles written before samples and variances were stored lack them
+            fields = [field for field in MATRIX_FIELDS if field in members]
+            if mmap:
+                arrays = {
+                    field: _memmap_member(path, bundle, members[field])
+                    for field in fields
+                }
+            else:
+                arrays = {
+                    field: _read_member(bundle, members[field]) for field in fields
+                }
+            return cls(
+                _read_member(bundle, members["names"]),
+                _read_member(bundle, members["points"]),
+                _read_member(bundle, members["hashes"]),
+                arrays,
+                str(_read_member(bundle, members["engine"])),
+                str(_read_member(bundle, members["seed"])) if "seed" in members else "",
+                (
+                    int(_read_member(bundle, members["version"]))
+                    if "version" in members
+                    else 0
+                ),
+                (
+                    str(_read_member(bundle, members["settings"]))
+                    if "settings" in members
+                    else ""
+                ),
+            )
+
+    def index_of(self, name: str) -> Optional[int]:
+        return self._index.get(name)
+
+    def index_of_hash(self, definition_hash: Optional[str]) -> Optional[int]:
+        """Row of the unit with this definition hash, whatever its position."""
+        return self._hash_index.get(definition_hash) if definition_hash else None
+
+    def has_unit(self, unit: Unit) -> bool:
+        """Whether the matrix holds results for this exact unit definition."""
+        i = self.index_of(unit.get_name())
+        return i is not None and str(self.hashes[i]) == unit.get_definition_hash()
+
+    def lookup(self, attacker_name: str, target_name: str) -> Optional[dict]:
+        """All fields for attacker striking target, or None if not evaluated."""
+        i = self.index_of(attacker_name)
+        j = self.index_of(target_name)
+        if i is None or j is None:
+            return None
+        return self.lookup_at(i, j)
+
+    def lookup_at(self, i: int, j: int) -> Optional[dict]:
+        if np.isnan(self.arrays["kill_rate"][i, j]):
+            return None
+        return {field: self.arrays[field][i, j].item() for field in self.arrays}
+
+    def combat_result(
+        self, attacker_name: str, target_name: str
+    ) -> Optional[CombatResult]:
+        i = self.index_of(attacker_name)
+        j = self.index_of(target_name)
+        if i is None or j is None:
+            return None
+        return self.combat_result_at(i, j)
+
+    def combat_result_at(self, i: int, j: int) -> Optional[CombatResult]:
+        values = self.lookup_at(i, j)
+        if values is None:
+            return None
+        record = np.zeros((), dtype=COMBAT_RESULT_DTYPE)
+        record["kill_rate_log_variance"] = np.nan
+        for field in COMBAT_RESULT_DTYPE.names:
+            if field in values:
+                record[field] = values[field]
+        return CombatResult.from_record(record)
+
+
+def _read_member(bundle: zipfile.ZipFile, member: str) -> np.ndarray:
+    with bundle.open(member) as file:
+        return np.lib.format.read_array(file)
+
+
+def _memmap_member(path: str, bundle: zipfile.ZipFile, member: str) -> np.ndarray:
+    """Memory-map an array stored uncompressed inside a zip bundle."""
+    info = bundle.getinfo(member)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return _read_member(bundle, member)
+
+    with open(path, "rb") as file:
+        file.seek(info.header_offset)
+        local_header = file.read(_LOCAL_HEADER_SIZE)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        file.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
@@ -0,0 +1,158 @@
+"""This module contains the MatchupPool class, which evaluates matchups on a
+pool of worker processes so that CPU-heavy simulations run concurrently."""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Hashable, Optional
+
+from combat_result import MatchupResult
+from combatants.unit import Unit, definition_hash
+from dieroll import DiceRoller
+from replay_log import ReplayLog, new_seed
+from simulate_combat import evaluate_matchup
+
+WORKER_UNIT_CACHE_SIZE = 1024
+# Workers are started from a fork server rather than forked from the web
+# process, whose request and job threads may hold locks at the time
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+)
+
+# Units parsed inside a worker process, keyed by definition hash
+_worker_units: dict[str, Unit] = {}
+
+
+def evaluate_definitions(
+    attacker_definition: dict,
+    target_definition: dict,
+    engine: str,
+    seed: Optional[int] = None,
+) -> MatchupResult:
+    """Evaluate a matchup from the JSON definitions of both units. Runs in a
+    worker process, which keeps parsed units so repeated matchups reuse them."""
+    attacker = _worker_unit(attacker_definition)
+    target = _worker_unit(target_definition)
+    return evaluate_matchup(attacker, target, engine, DiceRoller(seed))
+
+
+def _worker_unit(definition: dict) -> Unit:
+    key = definition_hash(definition)
+    unit = _worker_units.get(key)
+    if unit is None:
+        if len(_worker_units) >= WORKER_UNIT_CACHE_SIZE:
+            _worker_units.clear()
+        unit = Unit.from_json(definition)
+        _worker_units[key] = unit
+    return unit
+
+
+class MatchupPool:
+    """Lazily started process pool for matchup evaluations.
+
+    The pool is only created on first use, so a gunicorn master that preloads
+    the app does not fork workers with a running pool. It is shared by every
+    request thread of a worker, and submit_shared lets concurrent requests for
+    the same matchup wait on one evaluation. With a replay_log, evaluations
+    without a seed get a fresh one and are recorded in it when they finish."""
+
+    def __init__(
+        self, workers: Optional[int] = None, replay_log: Optional[ReplayLog] = None
+    ):
+        self._workers = workers or os.cpu_count() or 1
+        self._replay_log = replay_log
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Reentrant because a future that is already done runs its callback,
+        # which takes the lock too, inside add_done_callback
+        self._lock = threading.RLock()
+        self._inflight: dict[Hashable, Future] = {}
+        self.submitted = 0
+        self.coalesced = 0
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """The pool's executor, started on first use, for work other than
+        single matchups, such as the chunks of a sweep."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context(START_METHOD),
+                )
+            return self._executor
+
+    def submit(
+        self,
+        attacker: Unit,
+        target: Unit,
+        engine: str,
+        seed: Optional[int] = None,
+    ) -> "Future[MatchupResult]":
+        with self._lock:
+            executor = self.executor
+            self.submitted += 1
+            record = self._replay_log is not None and seed is None
+            if record:
+                seed = new_seed()
+            future = executor.submit(
+                evaluate_definitions,
+                attacker.get_definition(),
+                target.get_definition(),
+                engine,
+                seed,
+            )
+        if record:
+            future.add_done_callback(
+                lambda done: self._record(attacker, target, engine, seed, done)
+            )
+        return future
+
+    def submit_shared(
+        self, key: Hashable, attacker: Unit, target: Unit, engine: str
+    ) -> "Future[MatchupResult]":
+        """Like submit, but while an evaluation submitted under the same key is
+        still running its future is returned instead of starting another.
+
+        Keys such as the result cache's cover units that fight identically, so
+        callers rename the shared result for their own units."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self.submit(attacker, target, engine)
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+            return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self._workers,
+                "started": self._executor is not None,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def _record(
+        self, attacker: Unit, target: Unit, engine: str, seed: int, future: Future
+    ) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self._replay_log.record(attacker, target, engine, seed, future.result())
+
+    def _finish(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
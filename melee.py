@@ -0,0 +1,181 @@
+"""This module contains the multi-round melee engine, which follows the exact
+probability distribution of both units' remaining wounds through a fight
+instead of rolling every die."""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from combatants.unit import Combatant
+from combatant_roll_evaluator.matchup import compile_matchup
+from distribution import convolve_attacks
+
+DEFAULT_MODELS = 10
+MAX_ROUNDS = 10
+
+
+@lru_cache(maxsize=4096)
+def _strike_matrix(probability: float, attacks: int, hit_points: int) -> np.ndarray:
+    """Transition matrix [before, after] of a unit's remaining wounds when it
+    suffers attacks attacks that each wound with probability."""
+    wounds = convolve_attacks([probability] * attacks)
+    matrix = np.zeros((hit_points + 1, hit_points + 1))
+    for before in range(hit_points + 1):
+        after = np.maximum(before - np.arange(attacks + 1), 0)
+        np.add.at(matrix[before], after, wounds)
+    return matrix
+
+
+class _Side:
+    """One unit in a melee, with the strikes it can make at every number of
+    remaining wounds."""
+
+    def __init__(self, unit: Combatant, enemy: Combatant, models: int):
+        self.unit = unit
+        self.models = models
+        self.wounds_per_model = unit._wounds
+        self.hit_points = models * self.wounds_per_model
+        self.probability = compile_matchup(unit, enemy).wound_probability()
+
+    def models_alive(self, hit_points: np.ndarray) -> np.ndarray:
+        # Wounds carry over, so only the front model can be partly wounded
+        return -(-hit_points // self.wounds_per_model)
+
+    def strikes(self, enemy: "_Side") -> np.ndarray:
+        """Transition matrices [own wounds, enemy before, enemy after] of the
+        enemy's wounds when this side strikes with every model still alive."""
+        attacks = self.models_alive(np.arange(self.hit_points + 1))
+        return np.stack(
+            [
+                _strike_matrix(
+                    self.probability,
+                    int(alive) * self.unit.get_attacks(),
+                    enemy.hit_points,
+                )
+                for alive in attacks
+            ]
+        )
+
+
+class MeleeResult:
+    """Outcome of a melee as probabilities over both units' remaining wounds."""
+
+    def __init__(
+        self,
+        attacker: _Side,
+        target: _Side,
+        state: np.ndarray,
+        ended_by_round: list[float],
+    ):
+        self._attacker = attacker
+        self._target = target
+        # state[i, j] is the chance the attacker has i wounds left and the
+        # target j wounds left at the end of the fight
+        self.state = state
+        # Chance the fight was over by the end of each round
+        self.ended_by_round = ended_by_round
+
+        self.attacker_wins = float(state[1:, 0].sum())
+        self.target_wins = float(state[0, 1:].sum())
+        self.mutual_destruction = float(state[0, 0])
+        self.unresolved = float(state[1:, 1:].sum())
+
+    @property
+    def rounds(self) -> int:
+        return len(self.ended_by_round)
+
+    def models_remaining(self) -> tuple[np.ndarray, np.ndarray]:
+        """Distributions of the models left standing of attacker and target."""
+        attacker = np.bincount(
+            self._attacker.models_alive(np.arange(self._attacker.hit_points + 1)),
+            weights=self.state.sum(axis=1),
+        )
+        target = np.bincount(
+            self._target.models_alive(np.arange(self._target.hit_points + 1)),
+            weights=self.state.sum(axis=0),
+        )
+        return attacker, target
+
+    def expected_models_remaining(self) -> tuple[float, float]:
+        attacker, target = self.models_remaining()
+        return (
+            float(np.dot(np.arange(len(attacker)), attacker)),
+            float(np.dot(np.arange(len(target)), target)),
+        )
+
+    def to_json(self) -> dict:
+        attacker_models, target_models = self.expected_models_remaining()
+        return {
+            "attacker_wins": self.attacker_wins,
+            "target_wins": self.target_wins,
+            "mutual_destruction": self.mutual_destruction,
+            "unresolved": self.unresolved,
+            "attacker_models_remaining": attacker_models,
+            "target_models_remaining": target_models,
+            "ended_by_round": self.ended_by_round,
+        }
+
+
+def _strike_target(state: np.ndarray, strikes: np.ndarray) -> np.ndarray:
+    return (state[:, None, :] @ strikes)[:, 0, :]
+
+
+def _strike_attacker(state: np.ndarray, strikes: np.ndarray) -> np.ndarray:
+    return (state.T[:, None, :] @ strikes)[:, 0, :].T
+
+
+def simulate_melee(
+    attacker: Combatant,
+    target: Combatant,
+    attacker_models: int = DEFAULT_MODELS,
+    target_models: int = DEFAULT_MODELS,
+    max_rounds: int = MAX_ROUNDS,
+) -> MeleeResult:
+    """Fight rounds of melee until one side is wiped out or max_rounds is
+    reached.
+
+    Every round the unit with the higher initiative strikes first and its
+    casualties are removed before the other strikes back; units with equal
+    initiative strike simultaneously, as do units of which either has no
+    initiative. Each attack wounds with the exact per-attack probability of
+    the compiled matchup."""
+    first = _Side(attacker, target, attacker_models)
+    second = _Side(target, attacker, target_models)
+
+    state = np.zeros((first.hit_points + 1, second.hit_points + 1))
+    state[first.hit_points, second.hit_points] = 1.0
+
+    # first_strikes[i] moves the target's wounds when the attacker has i left,
+    # second_strikes[j] the attacker's wounds when the target has j left
+    first_strikes = first.strikes(second)
+    second_strikes = second.strikes(first)
+
+    attacker_initiative = attacker.get_initiative()
+    target_initiative = target.get_initiative()
+    if attacker_initiative is None or target_initiative is None:
+        # The schema makes initiative optional; with no order to strike in,
+        # both sides strike at once
+        attacker_initiative = target_initiative = 0
+
+    ended_by_round = []
+    for _ in range(max_rounds):
+        if attacker_initiative > target_initiative:
+            state = _strike_target(state, first_strikes)
+            state = _strike_attacker(state, second_strikes)
+        elif attacker_initiative < target_initiative:
+            state = _strike_attacker(state, second_strikes)
+            state = _strike_target(state, first_strikes)
+        else:
+            # Both strike with the models alive at the start of the step
+            moved = state[:, :, None] * second_strikes.transpose(1, 0, 2)
+            state = moved.reshape(-1, moved.shape[2]).T @ first_strikes.reshape(
+                -1, first_strikes.shape[2]
+            )
+
+        ended = 1.0 - float(state[1:, 1:].sum())
+        ended_by_round.append(ended)
+        if math.isclose(ended, 1.0):
+            break
+
+    return MeleeResult(first, second, state, ended_by_round)
@@ -0,0 +1,149 @@
+"""This module contains the points-efficiency optimizer, which ranks the units
+of a roster by how many points of the opponents they kill per point spent."""
+
+import heapq
+from typing import Optional
+
+from combatants.unit import Unit
+from combatant_roll_evaluator.combatant_roll_evaluator import Hit, HitWound
+from simulate_combat import simulate_combat, EXACT_ENGINE
+
+DEFAULT_LIMIT = 10
+
+
+class RankedUnit:
+    """A candidate unit with its efficiency against the opponents."""
+
+    __slots__ = ("unit", "models", "kill_rate", "efficiency")
+
+    def __init__(self, unit: Unit, models: Optional[int], kill_rate: float):
+        self.unit = unit
+        self.models = models
+        # Mean models killed per attacking model and round, over the opponents
+        self.kill_rate = kill_rate
+        self.efficiency = 0.0
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.unit.get_name(),
+            "points": self.unit._points,
+            "models": self.models,
+            "points_spent": (
+                None if self.models is None else self.models * self.unit._points
+            ),
+            "kill_rate": self.kill_rate,
+            "expected_kills": (
+                None if self.models is None else self.kill_rate * self.models
+            ),
+            "efficiency": self.efficiency,
+        }
+
+
+class Ranking:
+    """The best units found, with how many candidates needed a simulation."""
+
+    def __init__(self, ranked: list[RankedUnit], candidates: int, evaluated: int):
+        self.ranked = ranked
+        self.candidates = candidates
+        self.evaluated = evaluated
+
+    @property
+    def pruned(self) -> int:
+        return self.candidates - self.evaluated
+
+    def to_json(self) -> dict:
+        return {
+            "ranking": [entry.to_json() for entry in self.ranked],
+            "candidates": self.candidates,
+            "evaluated": self.evaluated,
+            "pruned": self.pruned,
+        }
+
+
+def kill_rate_bound(attacker: Unit, target: Unit) -> float:
+    """Upper bound on the kill rate of attacker against target from the hit
+    and wound probabilities alone, treating every wound as unsaved."""
+    return (
+        attacker.get_attacks()
+        * Hit(attacker, target).success_probability()
+        * HitWound(attacker, target).success_probability()
+        / target._wounds
+    )
+
+
+def rank_units(
+    candidates: list[Unit],
+    opponents: list[Unit],
+    budget: Optional[int] = None,
+    engine: str = EXACT_ENGINE,
+    limit: int = DEFAULT_LIMIT,
+) -> Ranking:
+    """The limit most points-efficient candidates against the opponents.
+
+    A candidate's efficiency is its kill_rate * target points / own points *
+    100, the attacker efficiency of MatchupResult, averaged over opponents.
+    With a budget, candidates costing more than it are skipped and each
+    entry says how many models the budget buys.
+
+    Candidates are visited in order of an analytic upper bound on their
+    efficiency, and the search stops as soon as the limit-th best simulated
+    efficiency beats the bound of every remaining candidate. Candidates with
+    the same combat signature share their simulations."""
+    eligible = [unit for unit in candidates if budget is None or unit._points <= budget]
+
+    # Points of opponents killed per model and round, by combat signature
+    bounds: dict[tuple, float] = {}
+    kills: dict[tuple, tuple[float, float]] = {}
+
+    def points_killed_bound(unit: Unit) -> float:
+        signature = unit.combat_signature()
+        if signature not in bounds:
+            bounds[signature] = sum(
+                kill_rate_bound(unit, opponent) * opponent._points
+                for opponent in opponents
+            ) / len(opponents)
+        return bounds[signature]
+
+    def kill_rate(unit: Unit) -> tuple[float, float]:
+        signature = unit.combat_signature()
+        if signature not in kills:
+            results = [
+                simulate_combat(unit, opponent, engine) for opponent in opponents
+            ]
+            kills[signature] = (
+                sum(result.kill_rate for result in results) / len(opponents),
+                sum(
+                    result.kill_rate * opponent._points
+                    for result, opponent in zip(results, opponents)
+                )
+                / len(opponents),
+            )
+        return kills[signature]
+
+    ordered = sorted(
+        eligible,
+        key=lambda unit: points_killed_bound(unit) / unit._points,
+        reverse=True,
+    )
+
+    # Min-heap of (efficiency, order, entry) holding the best entries so far
+    best: list[tuple[float, int, RankedUnit]] = []
+    evaluated = 0
+    for order, unit in enumerate(ordered):
+        bound = points_killed_bound(unit) / unit._points * 100
+        if len(best) == limit and best[0][0] >= bound:
+            break
+        evaluated += 1
+        mean_kill_rate, points_killed = kill_rate(unit)
+        entry = RankedUnit(
+            unit, None if budget is None else budget // unit._points, mean_kill_rate
+        )
+        entry.efficiency = points_killed / unit._points * 100
+        if len(best) < limit:
+            heapq.heappush(best, (entry.efficiency, -order, entry))
+        elif entry.efficiency > best[0][0]:
+            heapq.heapreplace(best, (entry.efficiency, -order, entry))
+
+    ranked = [entry for _, _, entry in sorted(best, key=lambda item: item[:2])]
+    ranked.reverse()
+    return Ranking(ranked, len(eligible), evaluated)
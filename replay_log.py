@@ -0,0 +1,250 @@
+"""This module contains the ReplayLog class, an append-only JSON lines log of
+evaluated matchups with everything needed to re-execute them bit for bit: the
+seed, the engine and its version and sampling settings, and the normalized
+definitions of both units.
+
+    python replay_log.py list replay.jsonl
+    python replay_log.py replay replay.jsonl --entry 12
+    python replay_log.py replay replay.jsonl --repeat 3
+
+replay re-executes entries and exits with status 1 if any result differs from
+the logged one, so replaying a whole log doubles as a regression test and a
+throughput benchmark."""
+
+import argparse
+import hashlib
+import secrets
+import sys
+import threading
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+import orjson
+
+from combat_result import COMBAT_RESULT_DTYPE, MatchupResult
+from combatants.unit import Unit
+from dieroll import DiceRoller
+from roster_loader import unit_from_definition
+from simulate_combat import ENGINE_VERSION, evaluate_matchup, sampling_settings
+
+DEFAULT_PATH = "replay.jsonl"
+SEED_BITS = 63  # Seeds stay within the integers every JSON parser reads exactly
+
+
+def new_seed() -> int:
+    return secrets.randbits(SEED_BITS)
+
+
+def result_digest(result: MatchupResult) -> str:
+    """SHA-256 of the raw bytes of both sides of a result, so that replayed
+    results are compared bit for bit rather than to a rounding tolerance."""
+    records = np.array(
+        [result.attacker_results.to_record(), result.target_results.to_record()],
+        dtype=COMBAT_RESULT_DTYPE,
+    )
+    return hashlib.sha256(records.tobytes()).hexdigest()
+
+
+class ReplayLog:
+    """Matchup evaluations appended to a JSON lines file.
+
+    A unit definition is written once per process, as a "unit" line before the
+    first "matchup" line that refers to it by definition hash. Every record is
+    appended with one write to a file opened in append mode, so threads and
+    processes sharing the log do not interleave their lines."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self._path = path
+        self._lock = threading.Lock()
+        self._written_units: set[str] = set()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def evaluate(self, attacker: Unit, target: Unit, engine: str) -> MatchupResult:
+        """evaluate_matchup with a fresh seed, recorded in the log."""
+        seed = new_seed()
+        result = evaluate_matchup(attacker, target, engine, DiceRoller(seed))
+        self.record(attacker, target, engine, seed, result)
+        return result
+
+    def record(
+        self,
+        attacker: Unit,
+        target: Unit,
+        engine: str,
+        seed: int,
+        result: MatchupResult,
+    ) -> None:
+        """Append a matchup evaluated by evaluate_matchup with DiceRoller(seed)."""
+        entry = {
+            "type": "matchup",
+            "time": time.time(),
+            "engine": engine,
+            "version": ENGINE_VERSION,
+            "settings": sampling_settings(),
+            "seed": seed,
+            "attacker": attacker.get_definition_hash(),
+            "target": target.get_definition_hash(),
+            "advantage_ratio": result.advantage_ratio,
+            "digest": result_digest(result),
+        }
+        # Held while writing, so no thread logs an entry for a unit another
+        # thread has claimed but not written yet
+        with self._lock:
+            lines = []
+            for unit in (attacker, target):
+                unit_hash = unit.get_definition_hash()
+                if unit_hash not in self._written_units:
+                    lines.append(
+                        {
+                            "type": "unit",
+                            "hash": unit_hash,
+                            "definition": unit.get_definition(),
+                        }
+                    )
+            lines.append(entry)
+            with open(self._path, "ab") as file:
+                file.write(
+                    b"".join(
+                        orjson.dumps(
+                            line,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE,
+                        )
+                        for line in lines
+                    )
+                )
+            self._written_units.update(line["hash"] for line in lines[:-1])
+
+
+def read_entries(path: str) -> Iterator[dict]:
+    """The matchup entries of a log in order, with the "attacker" and "target"
+    hashes replaced by the unit definitions they refer to."""
+    definitions = {}
+    with open(path, "rb") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            if record["type"] == "unit":
+                definitions[record["hash"]] = record["definition"]
+            elif record["type"] == "matchup":
+                for side in ("attacker", "target"):
+                    if record[side] not in definitions:
+                        raise ValueError(
+                            f"{path}:{number}: unit {record[side]} is not defined"
+                        )
+                    record[side] = definitions[record[side]]
+                yield record
+
+
+def is_replayable(entry: dict) -> bool:
+    """Whether the entry was logged by the current engine version with the
+    current sampling settings, the only ones it can be re-executed with."""
+    return (
+        entry["version"] == ENGINE_VERSION and entry["settings"] == sampling_settings()
+    )
+
+
+def replay_entry(
+    entry: dict, units: Optional[dict[bytes, Unit]] = None
+) -> MatchupResult:
+    """Re-execute a logged matchup. Units built from its definitions are kept
+    in units, keyed by definition, for the next entries to reuse."""
+    if units is None:
+        units = {}
+    sides = []
+    for definition in (entry["attacker"], entry["target"]):
+        key = orjson.dumps(definition, option=orjson.OPT_SORT_KEYS)
+        if key not in units:
+            units[key] = unit_from_definition(definition)
+        sides.append(units[key])
+    return evaluate_matchup(*sides, entry["engine"], DiceRoller(entry["seed"]))
+
+
+def replay(entries: list[dict]) -> dict:
+    """Re-execute entries, returning the indices of the entries whose result
+    differs from the logged one, of those that cannot be replayed, and the
+    time taken by the replayed ones."""
+    units: dict[bytes, Unit] = {}
+    mismatches = []
+    skipped = []
+    replayed = 0
+    seconds = 0.0
+    for index, entry in enumerate(entries):
+        if not is_replayable(entry):
+            skipped.append(index)
+            continue
+        start = time.perf_counter()
+        result = replay_entry(entry, units)
+        seconds += time.perf_counter() - start
+        replayed += 1
+        if result_digest(result) != entry["digest"]:
+            mismatches.append(index)
+    return {
+        "replayed": replayed,
+        "mismatches": mismatches,
+        "skipped": skipped,
+        "seconds": seconds,
+    }
+
+
+def describe(entry: dict) -> str:
+    return (
+        f"{entry['attacker']['name']} vs {entry['target']['name']} "
+        f"({entry['engine']}, seed {entry['seed']})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or replay logged matchups")
+    parser.add_argument("command", choices=("list", "replay"))
+    parser.add_argument("log", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument(
+        "--entry",
+        type=int,
+        action="append",
+        help="index of an entry to replay, as shown by list; all if omitted",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="replay the entries this many times, for timing",
+    )
+    args = parser.parse_args()
+
+    entries = list(read_entries(args.log))
+
+    if args.command == "list":
+        for index, entry in enumerate(entries):
+            print(
+                f"{index:6}  {entry['advantage_ratio']:8.2f}  {describe(entry)}"
+                f"{'' if is_replayable(entry) else '  [not replayable]'}"
+            )
+        sys.exit(0)
+
+    if args.entry:
+        for index in args.entry:
+            if not 0 <= index < len(entries):
+                parser.error(f"No entry {index} in {args.log}")
+        entries = [entries[index] for index in args.entry]
+        indices = args.entry
+    else:
+        indices = list(range(len(entries)))
+
+    mismatches = set()
+    for _ in range(args.repeat):
+        report = replay(entries)
+        mismatches.update(report["mismatches"])
+        rate = report["replayed"] / report["seconds"] if report["seconds"] else 0.0
+        print(
+            f"replayed {report['replayed']} entries in {report['seconds']:.3f} s "
+            f"({rate:.1f} per second), {len(report['mismatches'])} mismatched, "
+            f"{len(report['skipped'])} skipped"
+        )
+    for position in sorted(mismatches):
+        print(f"MISMATCH {indices[position]}: {describe(entries[position])}")
+    sys.exit(1 if mismatches else 0)
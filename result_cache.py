@@ -0,0 +1,114 @@
+"""This module contains the ResultCache class, a bounded LRU cache for combat
+results keyed by the content of the unit definitions that produced them."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class ResultCache:
+    """Thread-safe LRU cache with an optional time to live.
+
+    If a source file is given, the whole cache is dropped as soon as the file's
+    modification time or size changes."""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        source_path: Optional[str] = None,
+    ):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._source_path = source_path
+        self._source_stamp = self._stat_source()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash JSON-serialisable parts, such as unit definitions and engine
+        settings, into a cache key that ignores dictionary key order."""
+        normalized = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            self._check_source()
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries."""
+        with self._lock:
+            self._check_source()
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self._maxsize,
+                "ttl": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _is_expired(self, entry: tuple[float, Any]) -> bool:
+        return self._ttl is not None and time.monotonic() - entry[0] > self._ttl
+
+    def _stat_source(self) -> Optional[tuple[int, int]]:
+        if self._source_path is None:
+            return None
+        try:
+            stat = os.stat(self._source_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_source(self) -> None:
+        """Drop every entry if the source file changed. Callers hold the lock."""
+        if self._source_path is None:
+            return
+        stamp = self._stat_source()
+        if stamp != self._source_stamp:
+            self._source_stamp = stamp
+            self._entries.clear()
+            self.invalidations += 1
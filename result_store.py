@@ -0,0 +1,422 @@
+"""This module contains the ResultStore class, a SQLite database of every
+evaluated matchup keyed by the definition hashes of its units, the engine and
+the seed, so past results can be served and queried without simulating.
+
+    python result_store.py wins "Tomb Guard"
+    python result_store.py counters "Skeleton Warrior" --limit 10"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+from combat_result import (
+    COMBAT_RESULT_DTYPE,
+    TIE_THRESHOLD,
+    CombatResult,
+    MatchupResult,
+)
+from combatants.unit import Unit
+from simulate_combat import ENGINE_VERSION, settings_digest
+
+DEFAULT_PATH = "results.db"
+DEFAULT_LIMIT = 10
+BUSY_TIMEOUT = 30  # Seconds a writer waits for another process's transaction
+# Bound on the advantage ratio of one matchup when averaging them in counters,
+# so a side that cannot kill at all (a ratio of 0 or inf) counts as a
+# decisive result rather than making the mean infinite or dropping out of it
+COUNTER_RATIO_CAP = 100.0
+# Bumped with every change to the matchups table; a database of an older
+# schema has its stored matchups dropped
+SCHEMA_VERSION = 2
+
+SIDES = ("attacker", "target")
+RESULT_COLUMNS = tuple(
+    f"{side}_{field}" for side in SIDES for field in COMBAT_RESULT_DTYPE.names
+)
+_COLUMN_TYPES = {
+    f"{side}_{field}": ("INTEGER" if COMBAT_RESULT_DTYPE[field].kind == "i" else "REAL")
+    for side in SIDES
+    for field in COMBAT_RESULT_DTYPE.names
+}
+MATCHUP_COLUMNS = (
+    "attacker_hash",
+    "target_hash",
+    "engine",
+    "seed",
+    "version",
+    "settings",
+    "advantage_ratio",
+    *RESULT_COLUMNS,
+    "created_at",
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS units (
+    hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    definition TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_name ON units (name);
+CREATE TABLE IF NOT EXISTS matchups (
+    attacker_hash TEXT NOT NULL REFERENCES units (hash),
+    target_hash TEXT NOT NULL REFERENCES units (hash),
+    engine TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    advantage_ratio REAL NOT NULL,
+    {", ".join(f"{column} {_COLUMN_TYPES[column]}" for column in RESULT_COLUMNS)},
+    created_at REAL NOT NULL,
+    PRIMARY KEY (attacker_hash, target_hash, engine, seed, version, settings)
+);
+CREATE INDEX IF NOT EXISTS matchups_target
+    ON matchups (target_hash, engine, seed, version, settings);
+"""
+
+# A matchup as stored: the two units, engine, seed and result
+StoredMatchup = tuple[Unit, Unit, str, Optional[int], MatchupResult]
+
+
+class ResultStore:
+    """Matchup results in a SQLite database, one row per (attacker hash,
+    target hash, engine, seed, engine version, settings digest); an unseeded
+    result is stored with seed "". Only results of the current ENGINE_VERSION
+    and sampling settings are ever read back.
+
+    Every thread and process opens its own connection on first use, and the
+    database runs in WAL mode so readers do not wait for writers."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self._path = path
+        self._local = threading.local()
+        # Created on a connection of its own, so that a process forked after
+        # this, such as a gunicorn worker, does not inherit an open connection
+        connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            (schema_version,) = connection.execute("PRAGMA user_version").fetchone()
+            if schema_version < SCHEMA_VERSION:
+                # Stored results are only a cache of evaluations, so a table
+                # of an older layout is dropped rather than migrated
+                connection.execute("DROP TABLE IF EXISTS matchups")
+            connection.executescript(SCHEMA)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        finally:
+            connection.close()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def get(
+        self, attacker: Unit, target: Unit, engine: str, seed: Optional[int] = None
+    ) -> Optional[MatchupResult]:
+        """The stored result of exactly these unit definitions, if any. A
+        matchup stored the other way round serves its reverse."""
+        attacker_hash = attacker.get_definition_hash()
+        target_hash = target.get_definition_hash()
+        row = (
+            self._connection()
+            .execute(
+                f"""
+                SELECT {', '.join(RESULT_COLUMNS)}, attacker_hash != ? AS reversed
+                FROM matchups
+                WHERE ((attacker_hash = ? AND target_hash = ?)
+                    OR (attacker_hash = ? AND target_hash = ?))
+                    AND engine = ? AND seed = ? AND version = ? AND settings = ?
+                ORDER BY reversed
+                LIMIT 1
+                """,
+                (
+                    attacker_hash,
+                    attacker_hash,
+                    target_hash,
+                    target_hash,
+                    attacker_hash,
+                    engine,
+                    _seed_key(seed),
+                    ENGINE_VERSION,
+                    settings_digest(),
+                ),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        *values, reversed_units = row
+        attacker_results, target_results = _combat_results(values)
+        if reversed_units:
+            attacker_results, target_results = target_results, attacker_results
+        return MatchupResult(
+            attacker.get_name(),
+            attacker._points,
+            target.get_name(),
+            target._points,
+            attacker_results,
+            target_results,
+        )
+
+    def put(
+        self,
+        attacker: Unit,
+        target: Unit,
+        engine: str,
+        result: MatchupResult,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.put_many([(attacker, target, engine, seed, result)])
+
+    def put_many(self, matchups: Iterable[StoredMatchup]) -> int:
+        """Store matchups in one transaction, replacing earlier results with
+        the same key. Returns the number of matchups written."""
+        units = {}
+        rows = []
+        now = time.time()
+        settings = settings_digest()
+        for attacker, target, engine, seed, result in matchups:
+            for unit in (attacker, target):
+                units[unit.get_definition_hash()] = (
+                    unit.get_definition_hash(),
+                    unit.get_name(),
+                    unit._points,
+                    json.dumps(unit.get_definition(), sort_keys=True),
+                )
+            rows.append(
+                (
+                    attacker.get_definition_hash(),
+                    target.get_definition_hash(),
+                    engine,
+                    _seed_key(seed),
+                    ENGINE_VERSION,
+                    settings,
+                    result.advantage_ratio,
+                    *_record_values(result.attacker_results),
+                    *_record_values(result.target_results),
+                    now,
+                )
+            )
+        if not rows:
+            return 0
+
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO units VALUES (?, ?, ?, ?)", units.values()
+            )
+            connection.executemany(
+                f"INSERT OR REPLACE INTO matchups ({', '.join(MATCHUP_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(MATCHUP_COLUMNS))})",
+                rows,
+            )
+        return len(rows)
+
+    def wins(
+        self, unit: Unit, limit: int = DEFAULT_LIMIT, engine: Optional[str] = None
+    ) -> list[tuple[str, MatchupResult]]:
+        """The stored matchups the unit wins beyond the tie threshold, from
+        its side and with the engine that evaluated it, best advantage first."""
+        unit_hash = unit.get_definition_hash()
+        engine_filter, engine_args = _engine_filter(engine)
+        rows = (
+            self._connection()
+            .execute(
+                f"""
+                SELECT engine, opponent.name, opponent.points,
+                    {', '.join(RESULT_COLUMNS)}, 0 AS reversed,
+                    advantage_ratio AS advantage
+                FROM matchups JOIN units AS opponent
+                    ON opponent.hash = matchups.target_hash
+                WHERE attacker_hash = ? AND advantage_ratio > ? {engine_filter}
+                UNION ALL
+                SELECT engine, opponent.name, opponent.points,
+                    {', '.join(RESULT_COLUMNS)}, 1 AS reversed,
+                    CASE WHEN advantage_ratio = 0 THEN ?
+                        ELSE 1.0 / advantage_ratio END
+                FROM matchups JOIN units AS opponent
+                    ON opponent.hash = matchups.attacker_hash
+                WHERE target_hash = ? AND advantage_ratio < ? {engine_filter}
+                ORDER BY advantage DESC
+                LIMIT ?
+                """,
+                (
+                    unit_hash,
+                    1 + TIE_THRESHOLD,
+                    *engine_args,
+                    # The unit's advantage over a target that cannot kill it
+                    math.inf,
+                    unit_hash,
+                    1 - TIE_THRESHOLD,
+                    *engine_args,
+                    limit,
+                ),
+            )
+            .fetchall()
+        )
+        results = []
+        for engine_name, name, points, *values, reversed_units, _ in rows:
+            attacker_results, target_results = _combat_results(values)
+            if reversed_units:
+                attacker_results, target_results = target_results, attacker_results
+            results.append(
+                (
+                    engine_name,
+                    MatchupResult(
+                        unit.get_name(),
+                        unit._points,
+                        name,
+                        points,
+                        attacker_results,
+                        target_results,
+                    ),
+                )
+            )
+        return results
+
+    def counters(
+        self, unit: Unit, limit: int = DEFAULT_LIMIT, engine: Optional[str] = None
+    ) -> list[dict]:
+        """The units with the highest mean advantage ratio against this one
+        over all stored matchups, in either direction. Each ratio is clamped
+        to [1 / COUNTER_RATIO_CAP, COUNTER_RATIO_CAP] before averaging."""
+        unit_hash = unit.get_definition_hash()
+        engine_filter, engine_args = _engine_filter(engine)
+        bounds = (1 / COUNTER_RATIO_CAP, COUNTER_RATIO_CAP)
+        rows = (
+            self._connection()
+            .execute(
+                f"""
+                SELECT units.name, units.points, counter, AVG(advantage),
+                    COUNT(*) AS matchups
+                FROM (
+                    SELECT attacker_hash AS counter,
+                        MIN(MAX(advantage_ratio, ?), ?) AS advantage
+                    FROM matchups WHERE target_hash = ? {engine_filter}
+                    UNION ALL
+                    SELECT target_hash, 1.0 / MIN(MAX(advantage_ratio, ?), ?)
+                    FROM matchups WHERE attacker_hash = ? {engine_filter}
+                )
+                JOIN units ON units.hash = counter
+                GROUP BY counter
+                ORDER BY AVG(advantage) DESC
+                LIMIT ?
+                """,
+                (
+                    *bounds,
+                    unit_hash,
+                    *engine_args,
+                    *bounds,
+                    unit_hash,
+                    *engine_args,
+                    limit,
+                ),
+            )
+            .fetchall()
+        )
+        return [
+            {
+                "name": name,
+                "points": points,
+                "hash": counter,
+                "advantage_ratio": advantage,
+                "matchups": matchups,
+            }
+            for name, points, counter, advantage, matchups in rows
+        ]
+
+    def stats(self) -> dict:
+        connection = self._connection()
+        (matchups,) = connection.execute("SELECT COUNT(*) FROM matchups").fetchone()
+        (units,) = connection.execute("SELECT COUNT(*) FROM units").fetchone()
+        return {"path": self._path, "matchups": matchups, "units": units}
+
+    def close(self) -> None:
+        """Close this thread's connection."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection opened by the parent of a forked process is not reused
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = None
+            self._local.pid = os.getpid()
+        if self._local.connection is None:
+            self._local.connection = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT)
+            # In WAL mode this only risks the last transactions on power loss
+            self._local.connection.execute("PRAGMA synchronous=NORMAL")
+        return self._local.connection
+
+
+def _seed_key(seed: Optional[int]) -> str:
+    return "" if seed is None else str(seed)
+
+
+def _engine_filter(engine: Optional[str]) -> tuple[str, tuple]:
+    """SQL restricting matchups to the engine, if any, and to results of the
+    current engine version and sampling settings."""
+    current = "AND version = ? AND settings = ?"
+    if engine is None:
+        return current, (ENGINE_VERSION, settings_digest())
+    return f"AND engine = ? {current}", (engine, ENGINE_VERSION, settings_digest())
+
+
+def _record_values(result: CombatResult) -> tuple:
+    # SQLite stores NaN as NULL, which _combat_results turns back into NaN
+    return tuple(np.array(result.to_record(), dtype=COMBAT_RESULT_DTYPE).tolist())
+
+
+def _combat_results(values) -> tuple[CombatResult, CombatResult]:
+    """The attacker and target results of a row of RESULT_COLUMNS."""
+    size = len(COMBAT_RESULT_DTYPE.names)
+    records = np.array(
+        [
+            tuple(np.nan if value is None else value for value in values[:size]),
+            tuple(np.nan if value is None else value for value in values[size:]),
+        ],
+        dtype=COMBAT_RESULT_DTYPE,
+    )
+    return CombatResult.from_record(records[0]), CombatResult.from_record(records[1])
+
+
+if __name__ == "__main__":
+    from unit_registry import UnitRegistry
+
+    parser = argparse.ArgumentParser(description="Query stored matchup results")
+    parser.add_argument("query", choices=("wins", "counters"))
+    parser.add_argument("unit", help="name of a unit in the roster")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    parser.add_argument("--roster", default="units.json")
+    parser.add_argument("--engine", default=None)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+    if args.limit <= 0:
+        parser.error("--limit must be positive")
+
+    # Results are looked up for the unit's current definition in the roster
+    unit = UnitRegistry(args.roster).get(args.unit)
+    if unit is None:
+        sys.exit(f"Unknown unit {args.unit!r}")
+    store = ResultStore(args.db)
+
+    if args.query == "wins":
+        for engine, result in store.wins(unit, args.limit, args.engine):
+            print(
+                f"{result.advantage_ratio:8.2f}  vs {result.target_name} "
+                f"({result.target_points} points, {engine})"
+            )
+    else:
+        for counter in store.counters(unit, args.limit, args.engine):
+            print(
+                f"{counter['advantage_ratio']:8.2f}  {counter['name']} "
+                f"({counter['points']} points, {counter['matchups']} matchups)"
+            )
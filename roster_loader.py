@@ -0,0 +1,303 @@
+"""This module contains the roster loader, which validates unit definitions
+against a JSON Schema and builds units from them through a class registry that
+is resolved once at import."""
+
+import inspect
+from functools import lru_cache
+from typing import Any, Callable, Union
+
+import orjson
+from jsonschema.validators import validator_for
+
+import rules.rule
+import strategies.hit_strategy
+import strategies.regeneration_strategy
+import strategies.save_strategy
+import strategies.ward_strategy
+import strategies.wound_strategy
+from combatants.unit import Unit
+from rules.modifier import Modifier
+from strategies.roll_evaluation_strategy import RollEvaluationStrategy
+
+# Definition key, module and default class of every strategy of a unit
+STRATEGY_KEYS = {
+    "hit_strategy": (strategies.hit_strategy, "DefaultHitStrategy"),
+    "wound_strategy": (strategies.wound_strategy, "DefaultWoundStrategy"),
+    "save_strategy": (strategies.save_strategy, "DefaultSaveStrategy"),
+    "ward_strategy": (strategies.ward_strategy, "DefaultWardStrategy"),
+    "regeneration_strategy": (
+        strategies.regeneration_strategy,
+        "DefaultRegenerationStrategy",
+    ),
+}
+MODIFIER_KEYS = ("offensiveModifiers", "defensiveModifiers")
+MODIFIER_CACHE_SIZE = 1024
+
+
+def _classes(module: Any, base: type) -> dict[str, type]:
+    return {
+        name: cls
+        for name, cls in inspect.getmembers(module, inspect.isclass)
+        if issubclass(cls, base) and not inspect.isabstract(cls)
+    }
+
+
+# Strategy classes by definition key and class name, and modifier classes by
+# class name, as Unit.from_json used to look them up with importlib
+STRATEGY_CLASSES: dict[str, dict[str, type]] = {
+    key: _classes(module, RollEvaluationStrategy)
+    for key, (module, _) in STRATEGY_KEYS.items()
+}
+MODIFIER_CLASSES: dict[str, type] = _classes(rules.rule, Modifier)
+
+_MODIFIER_SCHEMA = {
+    "oneOf": [
+        {"enum": sorted(MODIFIER_CLASSES)},
+        {
+            "type": "object",
+            "required": ["class"],
+            "properties": {"class": {"enum": sorted(MODIFIER_CLASSES)}},
+        },
+    ]
+}
+
+UNIT_SCHEMA = {
+    "type": "object",
+    "required": [
+        "name",
+        "weapon_skill",
+        "strength",
+        "toughness",
+        "wounds",
+        "attacks",
+        "points",
+    ],
+    "properties": {
+        "name": {"type": "string", "minLength": 1},
+        "weapon_skill": {"type": "integer", "minimum": 0},
+        "ballistic_skill": {"type": "integer", "minimum": 0},
+        "strength": {"type": "integer", "minimum": 0},
+        "toughness": {"type": "integer", "minimum": 0},
+        "wounds": {"type": "integer", "minimum": 1},
+        "initiative": {"type": "integer", "minimum": 0},
+        "attacks": {"type": "integer", "minimum": 0},
+        "points": {"type": "integer", "minimum": 1},
+        **{key: {"enum": sorted(STRATEGY_CLASSES[key])} for key in STRATEGY_KEYS},
+        **{key: {"type": "array", "items": _MODIFIER_SCHEMA} for key in MODIFIER_KEYS},
+    },
+}
+
+ROSTER_SCHEMA = {
+    "type": "object",
+    "required": ["units"],
+    "properties": {"units": {"type": "array", "items": UNIT_SCHEMA}},
+}
+
+# JSON types of the schemas above and the Python types orjson parses them to
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "integer": int}
+
+
+def compile_schema(schema: dict) -> Callable[[Any], bool]:
+    """A predicate that is True for instances valid against schema.
+
+    Only the keywords the roster schemas use are supported. The predicate is
+    conservative: it may reject an instance jsonschema would accept, such as
+    the integer 1.0, but never the reverse, so jsonschema only has to run when
+    it fails, to tell valid instances apart and report the errors."""
+    checks: list[Callable[[Any], bool]] = []
+    for keyword, value in schema.items():
+        if keyword == "type":
+            expected = _JSON_TYPES[value]
+            if expected is int:
+                # bool is an int subclass but not a JSON integer
+                checks.append(lambda instance: type(instance) is int)
+            else:
+                checks.append(lambda instance, t=expected: isinstance(instance, t))
+        elif keyword == "enum":
+            allowed = frozenset(value)
+            checks.append(
+                lambda instance: isinstance(instance, str) and instance in allowed
+            )
+        elif keyword == "minimum":
+            checks.append(lambda instance, m=value: instance >= m)
+        elif keyword == "minLength":
+            checks.append(lambda instance, m=value: len(instance) >= m)
+        elif keyword == "required":
+            checks.append(
+                lambda instance, keys=frozenset(value): keys <= instance.keys()
+            )
+        elif keyword == "properties":
+            properties = {key: compile_schema(sub) for key, sub in value.items()}
+            checks.append(lambda instance: _properties_valid(instance, properties))
+        elif keyword == "items":
+            checks.append(
+                lambda instance, check=compile_schema(value): all(map(check, instance))
+            )
+        elif keyword == "oneOf":
+            options = [compile_schema(sub) for sub in value]
+            checks.append(
+                lambda instance: sum(check(instance) for check in options) == 1
+            )
+        else:
+            raise ValueError(f"Unsupported schema keyword {keyword!r}")
+
+    # The type check comes first in every schema, so later checks can rely on it
+    if len(checks) == 1:
+        return checks[0]
+    if len(checks) == 2:
+        first, second = checks
+        return lambda instance: first(instance) and second(instance)
+    return lambda instance: all(check(instance) for check in checks)
+
+
+def _properties_valid(
+    instance: dict, properties: dict[str, Callable[[Any], bool]]
+) -> bool:
+    for key, value in instance.items():
+        check = properties.get(key)
+        if check is not None and not check(value):
+            return False
+    return True
+
+
+_roster_validator = validator_for(ROSTER_SCHEMA)(ROSTER_SCHEMA)
+_unit_validator = validator_for(UNIT_SCHEMA)(UNIT_SCHEMA)
+_roster_check = compile_schema(ROSTER_SCHEMA)
+_unit_check = compile_schema(UNIT_SCHEMA)
+
+
+class RosterValidationError(ValueError):
+    """A roster or unit definition that does not match the schema."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def validate_unit(definition: Any) -> None:
+    """Raise RosterValidationError listing every error if definition does not
+    match UNIT_SCHEMA."""
+    if not _unit_check(definition):
+        _raise_errors(_unit_validator, definition)
+
+
+def validate_roster(roster: Any) -> None:
+    """Raise RosterValidationError listing every error if roster does not
+    match ROSTER_SCHEMA."""
+    if not _roster_check(roster):
+        _raise_errors(_roster_validator, roster)
+
+
+def unit_from_definition(definition: dict, copy_definition: bool = True) -> Unit:
+    """Build a unit from its JSON definition without modifying it.
+
+    The unit keeps the definition for hashing; pass copy_definition=False if
+    the caller will not change the dict afterwards, to skip the copy."""
+    fields = {
+        key: value
+        for key, value in definition.items()
+        if key not in STRATEGY_KEYS and key not in MODIFIER_KEYS
+    }
+    unit = Unit(**fields)
+    unit._definition = (
+        orjson.loads(orjson.dumps(definition)) if copy_definition else definition
+    )
+
+    unit.set_hit_strategy(_strategy(definition, "hit_strategy"))
+    unit.set_wound_strategy(_strategy(definition, "wound_strategy"))
+    unit.set_save_strategy(_strategy(definition, "save_strategy"))
+    unit.set_ward_strategy(_strategy(definition, "ward_strategy"))
+    unit.set_regeneration_strategy(_strategy(definition, "regeneration_strategy"))
+    for key, add_modifier in (
+        ("defensiveModifiers", unit.add_defensive_modifier),
+        ("offensiveModifiers", unit.add_offensive_modifier),
+    ):
+        for index, modifier_data in enumerate(definition.get(key, ())):
+            try:
+                add_modifier(_modifier(modifier_data))
+            except RosterValidationError as error:
+                raise _prefixed(error, f"{key}/{index}: ") from None
+    return unit
+
+
+def load_roster(source: Union[str, bytes], validate: bool = True) -> list[Unit]:
+    """Parse a roster from a file path or the raw JSON bytes of one."""
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            source = file.read()
+    roster = orjson.loads(source)
+    if validate:
+        validate_roster(roster)
+    # The parsed dicts belong to this call, so units can keep them uncopied
+    units = []
+    for index, definition in enumerate(roster["units"]):
+        try:
+            units.append(unit_from_definition(definition, copy_definition=False))
+        except RosterValidationError as error:
+            raise _prefixed(error, f"units/{index}/") from None
+    return units
+
+
+def _strategy(definition: dict, key: str) -> RollEvaluationStrategy:
+    _, default = STRATEGY_KEYS[key]
+    return _strategy_instance(key, definition.get(key, default))
+
+
+def _modifier(modifier_data: Union[str, dict]) -> Modifier:
+    if isinstance(modifier_data, dict):
+        # The class name and the parameters of its constructor, as JSON so
+        # that list and dict parameters can be part of the cache key
+        name = modifier_data["class"]
+        parameters = tuple(
+            sorted(
+                (key, orjson.dumps(value, option=orjson.OPT_SORT_KEYS))
+                for key, value in modifier_data.items()
+                if key != "class"
+            )
+        )
+    else:
+        name = modifier_data
+        parameters = ()
+    return _modifier_instance(name, parameters)
+
+
+# Strategies and modifiers are not changed after construction, so units built
+# by the loader share one instance of each class and parameters
+
+
+@lru_cache(maxsize=None)
+def _strategy_instance(key: str, name: str) -> RollEvaluationStrategy:
+    try:
+        return STRATEGY_CLASSES[key][name]()
+    except KeyError:
+        raise RosterValidationError([f"{key}: unknown strategy {name!r}"]) from None
+
+
+@lru_cache(maxsize=MODIFIER_CACHE_SIZE)
+def _modifier_instance(name: str, parameters: tuple) -> Modifier:
+    try:
+        modifier_class = MODIFIER_CLASSES[name]
+    except KeyError:
+        raise RosterValidationError([f"unknown modifier {name!r}"]) from None
+    try:
+        return modifier_class(**{key: orjson.loads(value) for key, value in parameters})
+    except (AssertionError, TypeError, ValueError) as error:
+        # A missing or unknown keyword, or a value the constructor rejects
+        raise RosterValidationError(
+            [f"invalid parameters for {name}: {str(error) or 'value out of range'}"]
+        ) from None
+
+
+def _prefixed(error: RosterValidationError, prefix: str) -> RosterValidationError:
+    """The errors of a part of a definition, located within the whole."""
+    return RosterValidationError([prefix + message for message in error.errors])
+
+
+def _raise_errors(validator: Any, instance: Any) -> None:
+    errors = [
+        f"{'/'.join(str(part) for part in error.absolute_path) or '<root>'}: "
+        f"{error.message}"
+        for error in validator.iter_errors(instance)
+    ]
+    if errors:
+        raise RosterValidationError(errors)
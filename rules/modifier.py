@@ -1,7 +1,35 @@
 """This module contains the Modifier abstract base class."""
 
+import json
 from abc import ABC
+from typing import Any
+
+
+def signature_value(value: Any) -> Any:
+    """A parameter value in a hashable form: list and dict values are replaced
+    by their JSON with sorted keys, so equal values give equal signatures
+    whatever their order."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def parameter_signature(instance: Any) -> tuple:
+    """The class and attributes of a modifier or strategy as a hashable tuple."""
+    return (
+        type(instance).__name__,
+        tuple(
+            sorted(
+                (name, signature_value(value)) for name, value in vars(instance).items()
+            )
+        ),
+    )
 
 
 class Modifier(ABC):
     """Abstract base class for all modifiers."""
+
+    def signature(self) -> tuple:
+        """The class and parameters that determine what this modifier does, so
+        equal signatures mean interchangeable modifiers."""
+        return parameter_signature(self)
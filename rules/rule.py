@@ -1,5 +1,9 @@
 from abc import abstractmethod
-from random import randint
+from typing import Callable, Optional
+
+import numpy as np
+
+from dieroll import DiceRoller, default_roller
 from combatants.combatant import Combatant
 from strategies.roll_evaluation_strategy import RollEvaluationStrategy
 from rules.modifier import Modifier
@@ -13,8 +17,46 @@ class AutoSuccessModifierRule(Rule):
     """Abstract base class for all rules that determine if a roll is an automatic success."""
 
     @abstractmethod
-    def is_auto_success(self, attacker: Combatant, target: Combatant) -> bool:
-        """Determine if the roll is an automatic success."""
+    def is_auto_success(
+        self,
+        attacker: Combatant,
+        target: Combatant,
+        rng: Optional[DiceRoller] = None,
+    ) -> bool:
+        """Determine if the roll is an automatic success. Rules that roll dice
+        draw them from rng, or the default roller if none is given."""
+
+    def auto_success_probability(self, attacker: Combatant, target: Combatant) -> float:
+        """Probability that the roll is an automatic success.
+
+        Rules that roll their own dice in is_auto_success must override this."""
+        return 1.0 if self.is_auto_success(attacker, target) else 0.0
+
+    def compile_auto_success(
+        self, attacker: Combatant, target: Combatant
+    ) -> Callable[[DiceRoller], bool]:
+        """is_auto_success for this attacker and target as a function of the
+        dice alone, with everything that does not depend on the roll resolved
+        once.
+
+        Rules that roll their own dice in is_auto_success must override this."""
+        auto_success = bool(self.is_auto_success(attacker, target))
+        return lambda rng: auto_success
+
+    def auto_successes(
+        self,
+        count: int,
+        attacker: Combatant,
+        target: Combatant,
+        rng: Optional[DiceRoller] = None,
+    ) -> np.ndarray:
+        """Determine count automatic successes at once.
+
+        Falls back to calling is_auto_success once per roll."""
+        return np.array(
+            [bool(self.is_auto_success(attacker, target, rng)) for _ in range(count)],
+            dtype=bool,
+        )
 
 
 class AutoHitModifier(AutoSuccessModifierRule):
@@ -27,7 +69,12 @@ class AutoWoundModifier(AutoSuccessModifierRule):
 
 class AutoPenetrateArmourModifier(AutoSuccessModifierRule):
 
-    def is_auto_success(self, attacker: Combatant, target: Combatant) -> bool:
+    def is_auto_success(
+        self,
+        attacker: Combatant,
+        target: Combatant,
+        rng: Optional[DiceRoller] = None,
+    ) -> bool:
         pass
 
 
@@ -41,12 +88,48 @@ class AutoPenetrateRegenerationModifier(AutoSuccessModifierRule):
 
 class CleavingBlow(AutoPenetrateArmourModifier, AutoPenetrateRegenerationModifier):
 
-    def is_auto_success(self, attacker: Combatant, target: Combatant) -> bool:
+    def is_auto_success(
+        self,
+        attacker: Combatant,
+        target: Combatant,
+        rng: Optional[DiceRoller] = None,
+    ) -> bool:
         # TODO: Check for unit type
 
         wound_strategy: RollEvaluationStrategy = attacker._wound_strategy
         roll_lower_bound = wound_strategy.get_target_number(attacker, target)
-        return randint(roll_lower_bound, 6) == 6
+        if roll_lower_bound > 6:
+            return False
+        return (rng or default_roller()).randint(roll_lower_bound, 6) == 6
+
+    def compile_auto_success(
+        self, attacker: Combatant, target: Combatant
+    ) -> Callable[[DiceRoller], bool]:
+        wound_strategy: RollEvaluationStrategy = attacker._wound_strategy
+        roll_lower_bound = wound_strategy.get_target_number(attacker, target)
+        if roll_lower_bound > 6:
+            return lambda rng: False
+        return lambda rng: rng.randint(roll_lower_bound, 6) == 6
+
+    def auto_success_probability(self, attacker: Combatant, target: Combatant) -> float:
+        wound_strategy: RollEvaluationStrategy = attacker._wound_strategy
+        roll_lower_bound = wound_strategy.get_target_number(attacker, target)
+        if roll_lower_bound > 6:
+            return 0.0
+        return 1 / (7 - roll_lower_bound)
+
+    def auto_successes(
+        self,
+        count: int,
+        attacker: Combatant,
+        target: Combatant,
+        rng: Optional[DiceRoller] = None,
+    ) -> np.ndarray:
+        wound_strategy: RollEvaluationStrategy = attacker._wound_strategy
+        roll_lower_bound = wound_strategy.get_target_number(attacker, target)
+        if roll_lower_bound > 6:
+            return np.zeros(count, dtype=bool)
+        return (rng or default_roller()).randints(roll_lower_bound, 6, count) == 6
 
 
 class RollModifierRule(Rule):
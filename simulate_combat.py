@@ -1,17 +1,101 @@
+import hashlib
+import json
+from typing import Optional
+
+import numpy as np
+
 from combatants.unit import Combatant
-from combat_result import CombatResult
-from combatant_roll_evaluator.combatant_roll_evaluator import (
-    Hit,
-    HitWound,
-    ArmourSave,
-    WardSave,
-    RegenerationSave,
-)
+from dieroll import DiceRoller, PrefetchedRoller, default_roller
+from combat_result import CombatResult, MatchupResult
+from combatant_roll_evaluator.matchup import STAGES, CompiledMatchup, compile_matchup
+from confidence import log_product_variance, wilson_half_width
+from distribution import CombatDistribution
 
 SAMPLESIZE = 10000
 
+MONTE_CARLO_ENGINE = "montecarlo"
+EXACT_ENGINE = "exact"
+VECTORIZED_ENGINE = "vectorized"
+ADAPTIVE_ENGINE = "adaptive"
+ENGINES = (MONTE_CARLO_ENGINE, EXACT_ENGINE, VECTORIZED_ENGINE, ADAPTIVE_ENGINE)
+# Bumped whenever an engine draws or uses its dice differently, so that a
+# seeded result of an older version is not expected to be reproduced
+ENGINE_VERSION = 1
+
+# The adaptive engine rolls batches until every stage rate is known to within
+# RATE_TOLERANCE, or for a matchup until advantage_ratio is known to within
+# RATIO_TOLERANCE or the verdict is settled
+ADAPTIVE_BATCH_SIZE = 1000
+ADAPTIVE_MAX_SAMPLES = 100000
+# Samples after which a side that has not killed once settles a matchup: its
+# ratio of 0 or inf has no interval, so it would otherwise run to the maximum
+ADAPTIVE_MIN_DEGENERATE_SAMPLES = 10000
+RATE_TOLERANCE = 0.01
+RATIO_TOLERANCE = 0.02
+
+
+def sampling_settings() -> dict:
+    """The settings that, with the engine, determine how results are sampled."""
+    return {
+        "samplesize": SAMPLESIZE,
+        "adaptive_batch_size": ADAPTIVE_BATCH_SIZE,
+        "adaptive_max_samples": ADAPTIVE_MAX_SAMPLES,
+        "adaptive_min_degenerate_samples": ADAPTIVE_MIN_DEGENERATE_SAMPLES,
+        "rate_tolerance": RATE_TOLERANCE,
+        "ratio_tolerance": RATIO_TOLERANCE,
+    }
+
+
+def settings_digest() -> str:
+    """Digest of sampling_settings(), stored alongside results so that results
+    sampled under other settings are not served for the current ones."""
+    normalized = json.dumps(sampling_settings(), sort_keys=True)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def simulate_combat(
+    attacking_combatant: Combatant,
+    target_combatant: Combatant,
+    engine: str = MONTE_CARLO_ENGINE,
+    rng: Optional[DiceRoller] = None,
+    distribution: bool = False,
+):
+    """Estimate the combat result of an attacker striking a target. Sampling
+    engines draw their dice from rng, or the default roller if none is given;
+    pass DiceRoller(seed) for a reproducible result.
+
+    With distribution=True the result also carries a CombatDistribution of
+    wounds and models killed over all of the attacker's attacks."""
+    if engine == EXACT_ENGINE:
+        result = calculate_combat(attacking_combatant, target_combatant)
+    elif engine == VECTORIZED_ENGINE:
+        result = simulate_combat_vectorized(attacking_combatant, target_combatant, rng)
+    elif engine == ADAPTIVE_ENGINE:
+        result = simulate_combat_adaptive(attacking_combatant, target_combatant, rng)
+    elif engine == MONTE_CARLO_ENGINE:
+        result = simulate_combat_montecarlo(attacking_combatant, target_combatant, rng)
+    else:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+    if distribution:
+        result.distribution = CombatDistribution.from_result(
+            result, attacking_combatant.get_attacks(), target_combatant._wounds
+        )
+    return result
+
+
+def simulate_combat_montecarlo(
+    attacking_combatant: Combatant,
+    target_combatant: Combatant,
+    rng: Optional[DiceRoller] = None,
+):
+    """Monte Carlo simulation that rolls SAMPLESIZE dice per stage one by one."""
+    rng = rng or default_roller()
+
+    hit, wound, armour_save, ward_save, regeneration_save = compile_matchup(
+        attacking_combatant, target_combatant
+    ).stages
 
-def simulate_combat(attacking_combatant: Combatant, target_combatant: Combatant):
     hits = 0
     wounds = 0
     unsaved_wounds = 0
@@ -19,43 +103,199 @@ def simulate_combat(attacking_combatant: Combatant, target_combatant: Combatant)
     unregenerated_wounds = 0
 
     for _ in range(SAMPLESIZE):
-        hit = Hit(attacking_combatant, target_combatant)
-        if hit.evaluate_roll():
+        if hit.evaluate_roll(rng):
             hits += 1
-        wound = HitWound(attacking_combatant, target_combatant)
-        if wound.evaluate_roll():
+        if wound.evaluate_roll(rng):
             wounds += 1
-        armour_save = ArmourSave(attacking_combatant, target_combatant)
-        if armour_save.evaluate_roll():
+        if armour_save.evaluate_roll(rng):
             unsaved_wounds += 1
-        ward_save = WardSave(attacking_combatant, target_combatant)
-        if ward_save.evaluate_roll():
+        if ward_save.evaluate_roll(rng):
             unwarded_wounds += 1
-        regeneration_save = RegenerationSave(attacking_combatant, target_combatant)
-        if regeneration_save.evaluate_roll():
+        if regeneration_save.evaluate_roll(rng):
             unregenerated_wounds += 1
 
+    return build_combat_result(
+        attacking_combatant,
+        target_combatant,
+        hits / SAMPLESIZE,
+        wounds / SAMPLESIZE,
+        unsaved_wounds / SAMPLESIZE,
+        unwarded_wounds / SAMPLESIZE,
+        unregenerated_wounds / SAMPLESIZE,
+        samples=SAMPLESIZE,
+    )
+
+
+def evaluate_matchup(
+    attacker: Combatant,
+    target: Combatant,
+    engine: str = MONTE_CARLO_ENGINE,
+    rng: Optional[DiceRoller] = None,
+) -> MatchupResult:
+    """Simulate both directions of a pairing and weigh them against each other.
+
+    The vectorized engine draws the first roll of every stage in both
+    directions as one batch of dice rather than one batch per stage."""
+    if engine == ADAPTIVE_ENGINE:
+        return evaluate_matchup_adaptive(attacker, target, rng)
+    if engine == VECTORIZED_ENGINE:
+        rng = PrefetchedRoller(rng or default_roller(), 2 * len(STAGES) * SAMPLESIZE)
+    return MatchupResult(
+        attacker.get_name(),
+        attacker._points,
+        target.get_name(),
+        target._points,
+        simulate_combat(attacker, target, engine, rng),
+        simulate_combat(target, attacker, engine, rng),
+    )
+
+
+def simulate_combat_vectorized(
+    attacking_combatant: Combatant,
+    target_combatant: Combatant,
+    rng: Optional[DiceRoller] = None,
+):
+    """Monte Carlo simulation that rolls all SAMPLESIZE dice of a stage at once."""
+    rng = rng or default_roller()
+    matchup = compile_matchup(attacking_combatant, target_combatant)
+    rates = [
+        int(np.count_nonzero(stage.evaluate_rolls(SAMPLESIZE, rng))) / SAMPLESIZE
+        for stage in matchup.stages
+    ]
+    return build_combat_result(
+        attacking_combatant, target_combatant, *rates, samples=SAMPLESIZE
+    )
+
+
+def simulate_combat_adaptive(
+    attacking_combatant: Combatant,
+    target_combatant: Combatant,
+    rng: Optional[DiceRoller] = None,
+):
+    """Vectorized simulation that rolls batches until every stage rate is
+    known to within RATE_TOLERANCE, or ADAPTIVE_MAX_SAMPLES is reached."""
+    rng = rng or default_roller()
+    matchup = compile_matchup(attacking_combatant, target_combatant)
+    successes = np.zeros(len(matchup.stages), dtype=np.int64)
+    samples = 0
+    while samples < ADAPTIVE_MAX_SAMPLES:
+        successes += _sample_stages(matchup, ADAPTIVE_BATCH_SIZE, rng)
+        samples += ADAPTIVE_BATCH_SIZE
+        if all(
+            wilson_half_width(count, samples) <= RATE_TOLERANCE
+            for count in successes.tolist()
+        ):
+            break
+    return _result_from_successes(matchup, successes, samples)
+
+
+def evaluate_matchup_adaptive(
+    attacker: Combatant, target: Combatant, rng: Optional[DiceRoller] = None
+) -> MatchupResult:
+    """Simulate both directions of a pairing in batches until the interval on
+    advantage_ratio is within RATIO_TOLERANCE or settles the verdict, or
+    ADAPTIVE_MAX_SAMPLES is reached. A side that has not killed at all after
+    ADAPTIVE_MIN_DEGENERATE_SAMPLES settles it as well."""
+    rng = rng or default_roller()
+    forward = compile_matchup(attacker, target)
+    matchups = (forward, forward.reverse())
+    successes = [np.zeros(len(matchup.stages), dtype=np.int64) for matchup in matchups]
+    samples = 0
+    while True:
+        # The first rolls of both directions come from one batch of dice
+        batch = PrefetchedRoller(rng, 2 * len(STAGES) * ADAPTIVE_BATCH_SIZE)
+        for matchup, counts in zip(matchups, successes):
+            counts += _sample_stages(matchup, ADAPTIVE_BATCH_SIZE, batch)
+        samples += ADAPTIVE_BATCH_SIZE
+
+        result = MatchupResult(
+            attacker.get_name(),
+            attacker._points,
+            target.get_name(),
+            target._points,
+            *[
+                _result_from_successes(matchup, counts, samples)
+                for matchup, counts in zip(matchups, successes)
+            ],
+        )
+        if samples >= ADAPTIVE_MAX_SAMPLES or result.is_settled():
+            return result
+        if samples >= ADAPTIVE_MIN_DEGENERATE_SAMPLES and (
+            result.attacker_results.kill_rate == 0
+            or result.target_results.kill_rate == 0
+        ):
+            return result
+        interval = result.advantage_interval()
+        if (
+            interval is not None
+            and interval[1] / interval[0] <= 1 + 2 * RATIO_TOLERANCE
+        ):
+            return result
+
+
+def _sample_stages(matchup: CompiledMatchup, count: int, rng: DiceRoller) -> np.ndarray:
+    """Successes of count rolls for every stage of a matchup."""
+    return np.array(
+        [np.count_nonzero(stage.evaluate_rolls(count, rng)) for stage in matchup.stages]
+    )
+
+
+def _result_from_successes(
+    matchup: CompiledMatchup, successes: np.ndarray, samples: int
+) -> CombatResult:
+    return build_combat_result(
+        matchup.attacker,
+        matchup.target,
+        *[count / samples for count in successes.tolist()],
+        samples=samples,
+    )
+
+
+def calculate_combat(attacking_combatant: Combatant, target_combatant: Combatant):
+    """Compute the combat result exactly from the per-stage success probabilities."""
+    matchup = compile_matchup(attacking_combatant, target_combatant)
+    probabilities = [stage.success_probability() for stage in matchup.stages]
+    return build_combat_result(attacking_combatant, target_combatant, *probabilities)
+
+
+def build_combat_result(
+    attacking_combatant: Combatant,
+    target_combatant: Combatant,
+    hit_probability: float,
+    wound_probability: float,
+    unsaved_probability: float,
+    unwarded_probability: float,
+    unregenerated_probability: float,
+    samples: Optional[int] = None,
+) -> CombatResult:
+    """Chain the per-stage success probabilities into a CombatResult. For
+    sampled probabilities, samples is the number of rolls per stage."""
     attacks = attacking_combatant.get_attacks()
-    hit_rate = (hits / SAMPLESIZE) * attacks
-    raw_wound_rate = wounds / SAMPLESIZE
-    wound_rate = ((wounds * hits) / (SAMPLESIZE * SAMPLESIZE)) * attacks
-    raw_unsaved_rate = unsaved_wounds / SAMPLESIZE
-    unsaved_rate = (
-        (wounds * hits * unsaved_wounds) / (SAMPLESIZE * SAMPLESIZE * SAMPLESIZE)
-    ) * attacks
-    raw_unwarded_rate = unwarded_wounds / SAMPLESIZE
-    unwarded_rate = (
-        (wounds * hits * unsaved_wounds * unwarded_wounds)
-        / (SAMPLESIZE * SAMPLESIZE * SAMPLESIZE * SAMPLESIZE)
-    ) * attacks
-    raw_unregenerated_rate = unregenerated_wounds / SAMPLESIZE
-    unregenerated_rate = (
-        (wounds * hits * unsaved_wounds * unwarded_wounds * unregenerated_wounds)
-        / (SAMPLESIZE * SAMPLESIZE * SAMPLESIZE * SAMPLESIZE * SAMPLESIZE)
-    ) * attacks
+    hit_rate = hit_probability * attacks
+    raw_wound_rate = wound_probability
+    wound_rate = hit_probability * wound_probability * attacks
+    raw_unsaved_rate = unsaved_probability
+    unsaved_rate = wound_rate * unsaved_probability
+    raw_unwarded_rate = unwarded_probability
+    unwarded_rate = unsaved_rate * unwarded_probability
+    raw_unregenerated_rate = unregenerated_probability
+    unregenerated_rate = unwarded_rate * unregenerated_probability
 
     kill_rate = unregenerated_rate / target_combatant._wounds
 
+    kill_rate_log_variance = None
+    if samples is not None:
+        probabilities = (
+            hit_probability,
+            wound_probability,
+            unsaved_probability,
+            unwarded_probability,
+            unregenerated_probability,
+        )
+        kill_rate_log_variance = log_product_variance(
+            [round(probability * samples) for probability in probabilities], samples
+        )
+
     return CombatResult(
         hit_rate,
         raw_wound_rate,
@@ -67,4 +307,6 @@ def simulate_combat(attacking_combatant: Combatant, target_combatant: Combatant)
         raw_unregenerated_rate,
         unregenerated_rate,
         kill_rate,
+        samples,
+        kill_rate_log_variance,
     )
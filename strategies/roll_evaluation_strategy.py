@@ -1,10 +1,16 @@
 from abc import ABC, abstractmethod
+
 from combatants.combatant import Combatant
+from rules.modifier import parameter_signature
 
 
 class RollEvaluationStrategy(ABC):
     """Abstract base class for all saving throw strategies."""
 
+    def signature(self) -> tuple:
+        """The class and parameters that determine what this strategy does."""
+        return parameter_signature(self)
+
     @abstractmethod
     def evaluate_roll(self, attacker: Combatant, target: Combatant, roll: int) -> bool:
         """Determine if the attacker hits the target based on the roll."""
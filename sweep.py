@@ -0,0 +1,500 @@
+"""What-if sweeps over unit definitions.
+
+    python sweep.py "Tomb Guard" Ushabti --vary attacker.strength '[3, 4, 5]' \\
+        --vary attacker.defensiveModifiers '["-Shield", "+HeavyArmour"]'
+
+Every combination of the varied fields is evaluated as a matchup between the
+modified attacker and target. Stage probabilities are cached by the stage's
+outcome signature, so a stage the varied fields do not change is computed once
+for the whole grid. Sampled stages are seeded by their signature as well, so
+every grid point sees the same dice for the same stage and the results do not
+depend on the number of workers."""
+
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Optional
+
+import numpy as np
+
+from combat_result import MatchupResult
+from combatants.unit import Unit
+from combatant_roll_evaluator.combatant_roll_evaluator import CombatantRollEvaluator
+from combatant_roll_evaluator.matchup import compile_matchup
+from dieroll import DiceRoller
+from roster_loader import RosterValidationError, unit_from_definition, validate_unit
+from simulate_combat import (
+    build_combat_result,
+    EXACT_ENGINE,
+    VECTORIZED_ENGINE,
+    SAMPLESIZE,
+)
+
+SWEEP_ENGINES = (EXACT_ENGINE, VECTORIZED_ENGINE)
+SIDES = ("attacker", "target")
+METRICS = ("advantage_ratio", "attacker_kill_rate", "target_kill_rate")
+MODIFIER_FIELDS = ("defensiveModifiers", "offensiveModifiers")
+CHUNKS_PER_WORKER = 4
+# Characters of the text heatmap, from the lowest value to the highest
+HEATMAP_SHADES = " .:-=+*#%@"
+
+# Stage probabilities of a worker process, shared by all chunks it evaluates
+_worker_cache: Optional["StageCache"] = None
+
+
+class SweepAxis:
+    """One varied field of the attacker's or target's definition.
+
+    For defensiveModifiers and offensiveModifiers a value may also be a
+    string "+Name" or "-Name", which adds or removes that modifier from the
+    unit's own list instead of replacing it."""
+
+    def __init__(self, side: str, field: str, values: list):
+        if side not in SIDES:
+            raise ValueError(f"Unknown side {side!r}, expected one of {SIDES}")
+        if not values:
+            raise ValueError(f"No values to sweep {side}.{field} over")
+        if field in MODIFIER_FIELDS and isinstance(values, list):
+            for value in values:
+                if isinstance(value, str) and value.lstrip("+-") == "":
+                    raise ValueError(
+                        f"Expected a modifier name in {side}.{field}, not {value!r}"
+                    )
+        self.side = side
+        self.field = field
+        self.values = values
+
+    @classmethod
+    def parse(cls, spec: str, values: list) -> "SweepAxis":
+        """Build an axis from "attacker.field" or "target.field"."""
+        side, _, field = spec.partition(".")
+        if not field:
+            raise ValueError(
+                f"Expected attacker.<field> or target.<field>, not {spec!r}"
+            )
+        return cls(side, field, values)
+
+    @property
+    def label(self) -> str:
+        return f"{self.side}.{self.field}"
+
+    def apply(self, definition: dict, value: Any) -> None:
+        """Set this axis' field of a definition to value, in place."""
+        if (
+            self.field in MODIFIER_FIELDS
+            and isinstance(value, str)
+            and value[:1] in ("+", "-")
+        ):
+            modifiers = definition.setdefault(self.field, [])
+            name = value[1:]
+            if value[0] == "+":
+                modifiers.append(name)
+            else:
+                definition[self.field] = [
+                    modifier
+                    for modifier in modifiers
+                    if _modifier_name(modifier) != name
+                ]
+        else:
+            definition[self.field] = copy.deepcopy(value)
+
+    def to_json(self) -> dict:
+        return {"field": self.label, "values": self.values}
+
+
+class StageCache:
+    """Success probabilities of stages keyed by their outcome signature."""
+
+    def __init__(self, engine: str = EXACT_ENGINE, seed: Optional[int] = None):
+        if engine not in SWEEP_ENGINES:
+            raise ValueError(
+                f"Unknown engine {engine!r}, expected one of {SWEEP_ENGINES}"
+            )
+        self.engine = engine
+        self.seed = seed
+        self._probabilities: dict[tuple, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def probability(self, stage: CombatantRollEvaluator) -> float:
+        signature = stage.outcome_signature()
+        probability = self._probabilities.get(signature)
+        if probability is not None:
+            self.hits += 1
+            return probability
+        self.misses += 1
+        if self.engine == EXACT_ENGINE:
+            probability = stage.success_probability()
+        else:
+            successes = stage.evaluate_rolls(SAMPLESIZE, self._stage_roller(signature))
+            probability = int(np.count_nonzero(successes)) / SAMPLESIZE
+        self._probabilities[signature] = probability
+        return probability
+
+    def _stage_roller(self, signature: tuple) -> DiceRoller:
+        if self.seed is None:
+            return DiceRoller()
+        digest = hashlib.sha256(repr(signature).encode("utf-8")).hexdigest()
+        return DiceRoller(
+            np.random.SeedSequence(self.seed, spawn_key=(int(digest[:16], 16),))
+        )
+
+
+class SweepResult:
+    """The matchup result of every grid point, in grid order with the last
+    axis varying fastest."""
+
+    def __init__(
+        self,
+        axes: list[SweepAxis],
+        results: list[MatchupResult],
+        engine: str,
+        stage_evaluations: int,
+        stage_reuses: int,
+    ):
+        self.axes = axes
+        self.results = results
+        self.engine = engine
+        self.stage_evaluations = stage_evaluations
+        self.stage_reuses = stage_reuses
+
+    def points(self) -> list[tuple]:
+        return list(itertools.product(*[axis.values for axis in self.axes]))
+
+    def values(self, metric: str = "advantage_ratio") -> np.ndarray:
+        """The metric over the grid, shaped by the axes' lengths."""
+        return np.array([_metric(result, metric) for result in self.results]).reshape(
+            [len(axis.values) for axis in self.axes]
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "engine": self.engine,
+            "axes": [axis.to_json() for axis in self.axes],
+            "stage_evaluations": self.stage_evaluations,
+            "stage_reuses": self.stage_reuses,
+            "points": [
+                {
+                    "values": dict(zip([axis.label for axis in self.axes], point)),
+                    **{metric: _metric(result, metric) for metric in METRICS},
+                    "winner": result.get_winner(),
+                }
+                for point, result in zip(self.points(), self.results)
+            ],
+        }
+
+    def format_table(self) -> str:
+        labels = [axis.label for axis in self.axes]
+        widths = [
+            max(len(label), *[len(_format_value(value)) for value in axis.values])
+            for label, axis in zip(labels, self.axes)
+        ]
+        header = "  ".join(label.ljust(width) for label, width in zip(labels, widths))
+        lines = [
+            f"{header}  {'advantage':>9}  {'att kill':>8}  {'tgt kill':>8}  winner"
+        ]
+        for point, result in zip(self.points(), self.results):
+            cells = "  ".join(
+                _format_value(value).ljust(width) for value, width in zip(point, widths)
+            )
+            lines.append(
+                f"{cells}  {result.advantage_ratio:9.3f}  "
+                f"{result.attacker_results.kill_rate:8.3f}  "
+                f"{result.target_results.kill_rate:8.3f}  "
+                f"{result.get_winner() or 'tie'}"
+            )
+        return "\n".join(lines)
+
+    def format_heatmap(self, metric: str = "advantage_ratio") -> str:
+        """The metric as a text heatmap over the first two axes, rows along
+        the first. A single axis is drawn as one row."""
+        if len(self.axes) > 2:
+            raise ValueError("A heatmap shows at most two axes")
+        grid = np.atleast_2d(self.values(metric))
+        rows = self.axes[0].values if len(self.axes) == 2 else [""]
+        columns = self.axes[-1].values
+        low, high = float(np.nanmin(grid)), float(np.nanmax(grid))
+
+        row_width = max(len(_format_value(value)) for value in rows)
+        cell_width = max(8, *[len(_format_value(value)) for value in columns])
+        title = self.axes[0].label if len(self.axes) == 2 else ""
+        lines = [
+            f"{metric} ({title + ' x ' if title else ''}{self.axes[-1].label})",
+            " " * row_width
+            + " "
+            + " ".join(_format_value(value).rjust(cell_width) for value in columns),
+        ]
+        for row_value, row in zip(rows, grid):
+            cells = []
+            for value in row:
+                shade = _shade(value, low, high)
+                cells.append(f"{value:.3f} {shade}".rjust(cell_width))
+            lines.append(
+                _format_value(row_value).ljust(row_width) + " " + " ".join(cells)
+            )
+        lines.append(f"shades {HEATMAP_SHADES!r} span {low:.3f} .. {high:.3f}")
+        return "\n".join(lines)
+
+
+def run_sweep(
+    attacker_definition: dict,
+    target_definition: dict,
+    axes: list[SweepAxis],
+    engine: str = EXACT_ENGINE,
+    workers: Optional[int] = 1,
+    seed: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> SweepResult:
+    """Evaluate the matchup at every combination of the axes' values.
+
+    With workers=1 the grid runs in this process; otherwise contiguous chunks
+    of it are fanned out to a process pool, each worker keeping its own stage
+    cache. The chunks run on executor if one is given, such as the web app's
+    shared pool, and on a pool of workers processes of their own otherwise."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    points = list(itertools.product(*[axis.values for axis in axes]))
+    # Fail on bad engines and definitions before starting any workers
+    StageCache(engine, seed)
+    validate_sweep(attacker_definition, target_definition, axes, points)
+
+    if workers == 1:
+        cache = StageCache(engine, seed)
+        results = [
+            evaluate_point(attacker_definition, target_definition, axes, point, cache)
+            for point in points
+        ]
+        return SweepResult(axes, results, engine, cache.misses, cache.hits)
+
+    chunksize = max(1, math.ceil(len(points) / (workers * CHUNKS_PER_WORKER)))
+    chunks = [points[k : k + chunksize] for k in range(0, len(points), chunksize)]
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as own_executor:
+            return _run_chunks(
+                own_executor,
+                attacker_definition,
+                target_definition,
+                axes,
+                chunks,
+                engine,
+                seed,
+            )
+    return _run_chunks(
+        executor, attacker_definition, target_definition, axes, chunks, engine, seed
+    )
+
+
+def _run_chunks(
+    executor: Executor,
+    attacker_definition: dict,
+    target_definition: dict,
+    axes: list[SweepAxis],
+    chunks: list[list[tuple]],
+    engine: str,
+    seed: Optional[int],
+) -> SweepResult:
+    futures = [
+        executor.submit(
+            _evaluate_chunk,
+            attacker_definition,
+            target_definition,
+            axes,
+            chunk,
+            engine,
+            seed,
+        )
+        for chunk in chunks
+    ]
+    results = []
+    evaluations = reuses = 0
+    for future in futures:
+        chunk_results, misses, hits = future.result()
+        results.extend(chunk_results)
+        evaluations += misses
+        reuses += hits
+    return SweepResult(axes, results, engine, evaluations, reuses)
+
+
+def point_definitions(
+    attacker_definition: dict,
+    target_definition: dict,
+    axes: list[SweepAxis],
+    point: tuple,
+) -> dict[str, dict]:
+    """The attacker's and target's definitions at one grid point, by side."""
+    definitions = {
+        "attacker": copy.deepcopy(attacker_definition),
+        "target": copy.deepcopy(target_definition),
+    }
+    for axis, value in zip(axes, point):
+        axis.apply(definitions[axis.side], value)
+    return definitions
+
+
+def validate_sweep(
+    attacker_definition: dict,
+    target_definition: dict,
+    axes: list[SweepAxis],
+    points: list[tuple],
+) -> None:
+    """Raise RosterValidationError if the definitions at any grid point are
+    not valid units, naming the side, the point and the failing field."""
+    checked: set[str] = set()
+    for point in points:
+        definitions = point_definitions(
+            attacker_definition, target_definition, axes, point
+        )
+        for side, definition in definitions.items():
+            # Most points share one side's definition with other points
+            key = json.dumps(definition, sort_keys=True)
+            if key in checked:
+                continue
+            checked.add(key)
+            try:
+                validate_unit(definition)
+                unit_from_definition(definition, copy_definition=False)
+            except RosterValidationError as error:
+                values = ", ".join(
+                    f"{axis.label}={_format_value(value)}"
+                    for axis, value in zip(axes, point)
+                )
+                raise RosterValidationError(
+                    [f"{side} at {values}: {message}" for message in error.errors]
+                ) from None
+
+
+def evaluate_point(
+    attacker_definition: dict,
+    target_definition: dict,
+    axes: list[SweepAxis],
+    point: tuple,
+    cache: StageCache,
+) -> MatchupResult:
+    """The matchup with the axes set to the values of one grid point."""
+    definitions = point_definitions(attacker_definition, target_definition, axes, point)
+    attacker = Unit.from_json(definitions["attacker"])
+    target = Unit.from_json(definitions["target"])
+
+    samples = None if cache.engine == EXACT_ENGINE else SAMPLESIZE
+    results = []
+    for striker, struck in ((attacker, target), (target, attacker)):
+        matchup = compile_matchup(striker, struck)
+        probabilities = [cache.probability(stage) for stage in matchup.stages]
+        results.append(
+            build_combat_result(striker, struck, *probabilities, samples=samples)
+        )
+    return MatchupResult(
+        attacker.get_name(),
+        attacker._points,
+        target.get_name(),
+        target._points,
+        *results,
+    )
+
+
+def _evaluate_chunk(
+    attacker_definition: dict,
+    target_definition: dict,
+    axes: list[SweepAxis],
+    points: list[tuple],
+    engine: str,
+    seed: Optional[int],
+) -> tuple[list[MatchupResult], int, int]:
+    global _worker_cache
+    if (
+        _worker_cache is None
+        or _worker_cache.engine != engine
+        or _worker_cache.seed != seed
+    ):
+        _worker_cache = StageCache(engine, seed)
+    misses, hits = _worker_cache.misses, _worker_cache.hits
+    results = [
+        evaluate_point(
+            attacker_definition, target_definition, axes, point, _worker_cache
+        )
+        for point in points
+    ]
+    return results, _worker_cache.misses - misses, _worker_cache.hits - hits
+
+
+def _metric(result: MatchupResult, metric: str) -> float:
+    if metric == "advantage_ratio":
+        return result.advantage_ratio
+    if metric == "attacker_kill_rate":
+        return result.attacker_results.kill_rate
+    if metric == "target_kill_rate":
+        return result.target_results.kill_rate
+    raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+
+
+def _modifier_name(modifier: Any) -> str:
+    return modifier["class"] if isinstance(modifier, dict) else modifier
+
+
+def _format_value(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _shade(value: float, low: float, high: float) -> str:
+    if not math.isfinite(value):
+        return "?"
+    if high == low:
+        return HEATMAP_SHADES[-1]
+    index = round((value - low) / (high - low) * (len(HEATMAP_SHADES) - 1))
+    return HEATMAP_SHADES[index]
+
+
+if __name__ == "__main__":
+    from unit_registry import UnitRegistry
+
+    parser = argparse.ArgumentParser(description="What-if sweep of a matchup")
+    parser.add_argument("attacker")
+    parser.add_argument("target")
+    parser.add_argument(
+        "--vary",
+        nargs=2,
+        action="append",
+        required=True,
+        metavar=("FIELD", "VALUES"),
+        help="attacker.<field> or target.<field> and a JSON list of values",
+    )
+    parser.add_argument("--engine", choices=SWEEP_ENGINES, default=EXACT_ENGINE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--format", choices=("table", "heatmap", "json"), default="table"
+    )
+    parser.add_argument("--metric", choices=METRICS, default="advantage_ratio")
+    parser.add_argument("--units", default="units.json")
+    args = parser.parse_args()
+
+    registry = UnitRegistry(args.units)
+    for name in (args.attacker, args.target):
+        if name not in registry:
+            parser.error(f"Unknown unit {name!r}")
+    sweep = run_sweep(
+        registry.get(args.attacker).get_definition(),
+        registry.get(args.target).get_definition(),
+        [SweepAxis.parse(field, json.loads(values)) for field, values in args.vary],
+        args.engine,
+        args.workers,
+        args.seed,
+    )
+
+    if args.format == "json":
+        json.dump(sweep.to_json(), sys.stdout, indent=2)
+    elif args.format == "heatmap":
+        print(sweep.format_heatmap(args.metric))
+    else:
+        print(sweep.format_table())
+    print(
+        f"\n{sweep.stage_evaluations} stage evaluations, "
+        f"{sweep.stage_reuses} reused",
+        file=sys.stderr,
+    )
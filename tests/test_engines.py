@@ -0,0 +1,81 @@
+"""Consistency of the sampling engines with the exact engine: every stage rate
+of a sampled result has to lie within a few Wilson half-widths of the exact
+probability, for every ordered pairing of units.json."""
+
+import json
+import os
+
+import pytest
+
+from combatants.unit import Unit
+from confidence import wilson_half_width
+from dieroll import DiceRoller
+from simulate_combat import (
+    ADAPTIVE_ENGINE,
+    ADAPTIVE_MIN_DEGENERATE_SAMPLES,
+    EXACT_ENGINE,
+    MONTE_CARLO_ENGINE,
+    VECTORIZED_ENGINE,
+    evaluate_matchup,
+    simulate_combat,
+)
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+SEED = 20240101
+HALF_WIDTHS = 3  # Tolerance in Wilson half-widths of the 95% interval
+
+
+def load_units() -> list[Unit]:
+    with open(UNITS_PATH, encoding="utf-8") as file:
+        return [Unit.from_json(definition) for definition in json.load(file)["units"]]
+
+
+UNITS = load_units()
+PAIRINGS = [
+    (attacker, target)
+    for attacker in UNITS
+    for target in UNITS
+    if attacker is not target
+]
+
+
+def stage_rates(result, attacks: int) -> list[float]:
+    """The success rate of one roll at every stage of a result."""
+    return [
+        result.hit_rate / attacks,
+        result.raw_wound_rate,
+        result.raw_unsaved_rate,
+        result.raw_unwarded_rate,
+        result.raw_unregenerated_rate,
+    ]
+
+
+@pytest.mark.parametrize(
+    "engine", (MONTE_CARLO_ENGINE, VECTORIZED_ENGINE, ADAPTIVE_ENGINE)
+)
+@pytest.mark.parametrize(
+    "attacker, target",
+    PAIRINGS,
+    ids=[f"{attacker.get_name()}-{target.get_name()}" for attacker, target in PAIRINGS],
+)
+def test_sampled_engine_agrees_with_exact(attacker, target, engine):
+    attacks = attacker.get_attacks()
+    exact = stage_rates(simulate_combat(attacker, target, EXACT_ENGINE), attacks)
+    sampled_result = simulate_combat(attacker, target, engine, DiceRoller(SEED))
+    sampled = stage_rates(sampled_result, attacks)
+    samples = sampled_result.samples
+
+    for stage, (expected, rate) in enumerate(zip(exact, sampled)):
+        tolerance = HALF_WIDTHS * wilson_half_width(round(rate * samples), samples)
+        assert (
+            abs(rate - expected) <= tolerance
+        ), f"stage {stage}: {engine} rate {rate:.4f} vs exact {expected:.4f}"
+
+
+def test_adaptive_settles_when_a_side_cannot_kill():
+    attacker = UNITS[0]
+    harmless = Unit.from_json({**UNITS[1].get_definition(), "attacks": 0})
+    result = evaluate_matchup(attacker, harmless, ADAPTIVE_ENGINE, DiceRoller(SEED))
+
+    assert result.advantage_ratio == float("inf")
+    assert result.attacker_results.samples == ADAPTIVE_MIN_DEGENERATE_SAMPLES
@@ -0,0 +1,83 @@
+"""The multi-round melee engine against closed-form results of one round."""
+
+import json
+import math
+import os
+
+import pytest
+
+from combatant_roll_evaluator.matchup import compile_matchup
+from melee import simulate_melee
+from roster_loader import unit_from_definition
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+
+with open(UNITS_PATH, encoding="utf-8") as file:
+    DEFINITIONS = json.load(file)["units"]
+
+
+def units(attacker_initiative, target_initiative):
+    """Single-wound, single-attack versions of two roster units."""
+    definitions = []
+    for definition, initiative in (
+        (DEFINITIONS[0], attacker_initiative),
+        (DEFINITIONS[1], target_initiative),
+    ):
+        definition = {**definition, "wounds": 1, "attacks": 1}
+        definition.pop("initiative", None)
+        if initiative is not None:
+            definition["initiative"] = initiative
+        definitions.append(unit_from_definition(definition))
+    return definitions
+
+
+def wound_probabilities(attacker, target):
+    return (
+        compile_matchup(attacker, target).wound_probability(),
+        compile_matchup(target, attacker).wound_probability(),
+    )
+
+
+def test_higher_initiative_strikes_first():
+    attacker, target = units(5, 1)
+    p, q = wound_probabilities(attacker, target)
+    result = simulate_melee(attacker, target, 1, 1, max_rounds=1)
+
+    assert result.attacker_wins == pytest.approx(p)
+    assert result.target_wins == pytest.approx((1 - p) * q)
+    assert result.mutual_destruction == pytest.approx(0)
+    assert result.unresolved == pytest.approx((1 - p) * (1 - q))
+
+
+@pytest.mark.parametrize("initiatives", [(3, 3), (None, 3), (3, None)])
+def test_equal_or_missing_initiative_strikes_simultaneously(initiatives):
+    attacker, target = units(*initiatives)
+    p, q = wound_probabilities(attacker, target)
+    result = simulate_melee(attacker, target, 1, 1, max_rounds=1)
+
+    assert result.attacker_wins == pytest.approx(p * (1 - q))
+    assert result.target_wins == pytest.approx((1 - p) * q)
+    assert result.mutual_destruction == pytest.approx(p * q)
+    assert result.unresolved == pytest.approx((1 - p) * (1 - q))
+
+
+def test_casualties_are_removed_before_striking_back():
+    attacker, target = units(5, 1)
+    p, q = wound_probabilities(attacker, target)
+    result = simulate_melee(attacker, target, 2, 3, max_rounds=1)
+
+    # The attacker's 2 attacks kill k of 3 models, whose survivors strike back
+    kills = [(1 - p) ** 2, 2 * p * (1 - p), p**2]
+    expected_target = sum(k_chance * (3 - k) for k, k_chance in enumerate(kills))
+    expected_attacker = 2 - sum(
+        k_chance
+        * sum(
+            math.comb(3 - k, hits) * q**hits * (1 - q) ** (3 - k - hits) * min(2, hits)
+            for hits in range(4 - k)
+        )
+        for k, k_chance in enumerate(kills)
+    )
+    attacker_models, target_models = result.expected_models_remaining()
+
+    assert target_models == pytest.approx(expected_target)
+    assert attacker_models == pytest.approx(expected_attacker)
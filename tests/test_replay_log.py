@@ -0,0 +1,37 @@
+"""Matchups recorded in a replay log re-execute to bit-identical results."""
+
+import os
+
+from replay_log import ReplayLog, read_entries, replay, result_digest
+from roster_loader import load_roster
+from simulate_combat import ADAPTIVE_ENGINE, MONTE_CARLO_ENGINE, VECTORIZED_ENGINE
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+
+UNITS = load_roster(UNITS_PATH)
+
+
+def test_logged_matchups_replay_bit_for_bit(tmp_path):
+    log = ReplayLog(str(tmp_path / "replay.jsonl"))
+    results = [
+        log.evaluate(UNITS[0], UNITS[1], engine)
+        for engine in (MONTE_CARLO_ENGINE, VECTORIZED_ENGINE, ADAPTIVE_ENGINE)
+    ]
+    entries = list(read_entries(log.path))
+
+    assert [entry["digest"] for entry in entries] == [
+        result_digest(result) for result in results
+    ]
+    report = replay(entries)
+    assert report["replayed"] == len(results)
+    assert report["mismatches"] == []
+    assert report["skipped"] == []
+
+
+def test_changed_result_is_reported(tmp_path):
+    log = ReplayLog(str(tmp_path / "replay.jsonl"))
+    log.evaluate(UNITS[0], UNITS[1], MONTE_CARLO_ENGINE)
+    (entry,) = read_entries(log.path)
+    entry["seed"] += 1
+
+    assert replay([entry])["mismatches"] == [0]
@@ -0,0 +1,61 @@
+"""Queries of the SQLite result store."""
+
+import json
+import os
+
+import pytest
+
+from combat_result import CombatResult, MatchupResult
+from result_store import ResultStore
+from roster_loader import unit_from_definition
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+
+with open(UNITS_PATH, encoding="utf-8") as file:
+    UNITS = [
+        unit_from_definition(definition) for definition in json.load(file)["units"]
+    ]
+
+
+def result(attacker, target, attacker_kill_rate, target_kill_rate) -> MatchupResult:
+    def combat_result(kill_rate):
+        return CombatResult(1, 1, 1, 1, 1, 1, 1, 1, 1, kill_rate)
+
+    return MatchupResult(
+        attacker.get_name(),
+        attacker._points,
+        target.get_name(),
+        target._points,
+        combat_result(attacker_kill_rate),
+        combat_result(target_kill_rate),
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    unit, *others = UNITS
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.put_many(
+        [
+            # Wins of unit from both sides, one against a target that cannot
+            # kill it, and a loss
+            (unit, others[0], "exact", None, result(unit, others[0], 0.5, 0.1)),
+            (others[1], unit, "exact", None, result(others[1], unit, 0.0, 0.4)),
+            (others[2], unit, "exact", None, result(others[2], unit, 0.3, 0.2)),
+            (unit, others[3], "exact", None, result(unit, others[3], 0.1, 0.9)),
+        ]
+    )
+    return store
+
+
+def test_wins_are_ordered_by_advantage_and_limited(store):
+    unit = UNITS[0]
+    wins = store.wins(unit, limit=10)
+    ratios = [matchup.advantage_ratio for _, matchup in wins]
+
+    assert ratios == sorted(ratios, reverse=True)
+    assert ratios[0] == float("inf")
+    assert all(ratio > 1 for ratio in ratios)
+    assert [matchup.target_name for _, matchup in store.wins(unit, limit=2)] == [
+        matchup.target_name for _, matchup in wins[:2]
+    ]
@@ -0,0 +1,62 @@
+"""Units built by roster_loader from definitions the schema accepts."""
+
+import copy
+import json
+import os
+
+import orjson
+import pytest
+
+from dieroll import DiceRoller
+from roster_loader import (
+    RosterValidationError,
+    load_roster,
+    unit_from_definition,
+    validate_unit,
+)
+from simulate_combat import EXACT_ENGINE, evaluate_matchup
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+
+with open(UNITS_PATH, encoding="utf-8") as file:
+    DEFINITIONS = json.load(file)["units"]
+
+
+def test_list_valued_extra_field_is_part_of_the_signature():
+    definition = copy.deepcopy(DEFINITIONS[0])
+    definition["keywords"] = ["Undead", "Infantry"]
+    validate_unit(definition)
+    unit = unit_from_definition(definition)
+    reordered = unit_from_definition(
+        {**definition, "keywords": ["Undead", "Infantry"], "banner": {"b": 1, "a": 2}}
+    )
+
+    hash(unit.combat_signature())
+    assert unit.combat_signature() != reordered.combat_signature()
+    assert (
+        reordered.combat_signature()
+        == unit_from_definition(
+            {**definition, "banner": {"a": 2, "b": 1}}
+        ).combat_signature()
+    )
+    target = unit_from_definition(DEFINITIONS[1])
+    result = evaluate_matchup(unit, target, EXACT_ENGINE, DiceRoller(1))
+    assert result.advantage_ratio > 0
+
+
+@pytest.mark.parametrize(
+    "modifier, message",
+    [
+        ({"class": "ArmourPiercing", "modifier": 9}, "invalid parameters"),
+        ({"class": "ArmourPiercing", "bogus": 1}, "unexpected keyword"),
+        ({"class": "ArmourPiercing"}, "missing 1 required"),
+    ],
+)
+def test_bad_modifier_parameters_name_the_unit_and_path(modifier, message):
+    roster = {"units": copy.deepcopy(DEFINITIONS)}
+    roster["units"][2]["offensiveModifiers"] = ["CleavingBlow", modifier]
+    with pytest.raises(RosterValidationError) as error:
+        load_roster(orjson.dumps(roster))
+    (error_message,) = error.value.errors
+    assert error_message.startswith("units/2/offensiveModifiers/1: ")
+    assert message in error_message
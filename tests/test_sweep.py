@@ -0,0 +1,49 @@
+"""What-if sweeps over fields of the units of units.json."""
+
+import json
+import os
+
+import pytest
+
+from roster_loader import RosterValidationError, unit_from_definition
+from simulate_combat import EXACT_ENGINE, evaluate_matchup
+from sweep import SweepAxis, run_sweep
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+
+with open(UNITS_PATH, encoding="utf-8") as file:
+    DEFINITIONS = json.load(file)["units"]
+
+
+def test_grid_points_match_direct_evaluation():
+    attacker, target = DEFINITIONS[0], DEFINITIONS[1]
+    sweep = run_sweep(attacker, target, [SweepAxis("attacker", "strength", [3, 4, 5])])
+    for strength, result in zip([3, 4, 5], sweep.results):
+        expected = evaluate_matchup(
+            unit_from_definition({**attacker, "strength": strength}),
+            unit_from_definition(target),
+            EXACT_ENGINE,
+        )
+        assert result.advantage_ratio == pytest.approx(expected.advantage_ratio)
+
+
+@pytest.mark.parametrize(
+    "field, values, message",
+    [
+        ("points", [0, 10], "points: 0 is less than the minimum of 1"),
+        ("wounds", [1, 0], "wounds: 0 is less than the minimum of 1"),
+        (
+            "offensiveModifiers",
+            [[{"class": "ArmourPiercing", "modifier": 9}]],
+            "offensiveModifiers/0: invalid parameters for ArmourPiercing",
+        ),
+    ],
+)
+def test_invalid_grid_points_are_rejected_before_evaluating(field, values, message):
+    with pytest.raises(RosterValidationError) as error:
+        run_sweep(
+            DEFINITIONS[0], DEFINITIONS[1], [SweepAxis("attacker", field, values)]
+        )
+    (error_message,) = error.value.errors
+    assert error_message.startswith(f"attacker at attacker.{field}=")
+    assert message in error_message
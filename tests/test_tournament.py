@@ -0,0 +1,30 @@
+"""Seeded tournaments give the same results whatever the number of workers."""
+
+import os
+
+import pytest
+
+from replay_log import result_digest
+from roster_loader import load_roster
+from simulate_combat import MONTE_CARLO_ENGINE, VECTORIZED_ENGINE
+from tournament import pairings, run_tournament
+
+UNITS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "units.json")
+SEED = 11
+
+UNITS = load_roster(UNITS_PATH)
+
+
+def digests(**options) -> dict[tuple[int, int], str]:
+    return {
+        (i, j): result_digest(result)
+        for i, j, result in run_tournament(UNITS, seed=SEED, **options)
+    }
+
+
+@pytest.mark.parametrize("engine", (MONTE_CARLO_ENGINE, VECTORIZED_ENGINE))
+def test_seeded_tournament_does_not_depend_on_workers(engine):
+    serial = digests(engine=engine, workers=1)
+
+    assert set(serial) == set(pairings(len(UNITS)))
+    assert digests(engine=engine, workers=2, chunksize=1) == serial
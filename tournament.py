@@ -0,0 +1,218 @@
+"""This module contains the round-robin tournament runner, which evaluates every
+pairing of a roster either serially or across a pool of worker processes."""
+
+import math
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+import numpy as np
+
+from dieroll import DiceRoller
+from combat_result import MatchupResult
+from combatants.unit import Unit
+from matchup_matrix import MatchupMatrix
+from simulate_combat import evaluate_matchup, MONTE_CARLO_ENGINE
+
+CHUNKS_PER_WORKER = 4
+
+# Units of the roster inside a worker process, set by _init_worker
+_worker_units: list[Unit] = []
+
+
+def pairings(unit_count: int) -> list[tuple[int, int]]:
+    """Every pairing of a roster, each considered only once."""
+    return [(i, j) for i in range(unit_count) for j in range(i + 1, unit_count)]
+
+
+def pairing_roller(seed: Optional[int], i: int, j: int) -> DiceRoller:
+    """The dice of one pairing, an independent substream of the tournament seed
+    so that it does not depend on which worker evaluates it or in which order.
+    Without a seed every pairing draws fresh entropy, so forked workers never
+    repeat each other's rolls."""
+    if seed is None:
+        return DiceRoller()
+    return DiceRoller(np.random.SeedSequence(seed, spawn_key=(i, j)))
+
+
+def evaluate_pairing(
+    units: list[Unit], i: int, j: int, engine: str, seed: Optional[int]
+) -> MatchupResult:
+    return evaluate_matchup(units[i], units[j], engine, pairing_roller(seed, i, j))
+
+
+def equivalent_pairings(
+    units: list[Unit], tasks: list[tuple[int, int]]
+) -> dict[tuple[int, int], list[tuple[int, int, bool]]]:
+    """Group pairings whose units have the same combat signatures.
+
+    Maps the first pairing of every group to the pairings (i, j, reversed)
+    that can reuse its result, reversed if their units are the other way
+    round; the first pairing lists itself."""
+    signatures = [unit.combat_signature() for unit in units]
+    groups: dict[tuple[int, int], list[tuple[int, int, bool]]] = {}
+    representatives: dict[tuple, tuple[int, int]] = {}
+    for i, j in tasks:
+        key = (signatures[i], signatures[j])
+        if key in representatives:
+            groups[representatives[key]].append((i, j, False))
+        elif key[::-1] in representatives:
+            groups[representatives[key[::-1]]].append((i, j, True))
+        else:
+            representatives[key] = (i, j)
+            groups[(i, j)] = [(i, j, False)]
+    return groups
+
+
+def stored_pairing(
+    store: MatchupMatrix, units: list[Unit], i: int, j: int
+) -> Optional[MatchupResult]:
+    """The result of a pairing from a previous tournament's matrix, if it
+    holds results for the current definitions of both units."""
+    a = store.index_of_hash(units[i].get_definition_hash())
+    b = store.index_of_hash(units[j].get_definition_hash())
+    if a is None or b is None:
+        return None
+    attacker_results = store.combat_result_at(a, b)
+    target_results = store.combat_result_at(b, a)
+    if attacker_results is None or target_results is None:
+        return None
+    return MatchupResult(
+        units[i].get_name(),
+        units[i]._points,
+        units[j].get_name(),
+        units[j]._points,
+        attacker_results,
+        target_results,
+    )
+
+
+def run_tournament(
+    units: list[Unit],
+    engine: str = MONTE_CARLO_ENGINE,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    dedupe: bool = True,
+    store: Optional[MatchupMatrix] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[tuple[int, int, MatchupResult]]:
+    """Evaluate every pairing of units, yielding (i, j, result) as results
+    finish. Results are in completion order, not pairing order.
+
+    With workers=1 the pairings run in this process; otherwise they are split
+    into chunks of chunksize pairings and fanned out to a process pool, or to
+    executor if one is given, such as the web app's shared pool. With a
+    seed, every pairing is seeded on its own, so the results are the same for
+    any number of workers. With dedupe, pairings of units with the same combat
+    signatures as an earlier pairing reuse its result.
+
+    With store, the matrix of a previous tournament with the same engine,
+    seed, engine version and sampling settings, pairings of two units whose
+    definition hashes are in it are served from it first, and only pairings
+    with a new or changed unit are evaluated. Reused results keep the dice of
+    the run that stored them."""
+    tasks = pairings(len(units))
+    if store is not None and store.matches(engine, seed):
+        remaining = []
+        for i, j in tasks:
+            result = stored_pairing(store, units, i, j)
+            if result is None:
+                remaining.append((i, j))
+            else:
+                yield i, j, result
+        tasks = remaining
+
+    if not dedupe:
+        yield from _run_pairings(
+            units, tasks, engine, workers, seed, chunksize, executor
+        )
+        return
+
+    groups = equivalent_pairings(units, tasks)
+    for i, j, result in _run_pairings(
+        units, list(groups), engine, workers, seed, chunksize, executor
+    ):
+        for k, l, reversed_units in groups[(i, j)]:
+            shared = result.reversed() if reversed_units else result
+            yield k, l, shared.renamed(
+                units[k].get_name(),
+                units[k]._points,
+                units[l].get_name(),
+                units[l]._points,
+            )
+
+
+def _run_pairings(
+    units: list[Unit],
+    tasks: list[tuple[int, int]],
+    engine: str,
+    workers: Optional[int],
+    seed: Optional[int],
+    chunksize: Optional[int],
+    executor: Optional[Executor] = None,
+) -> Iterator[tuple[int, int, MatchupResult]]:
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        for i, j in tasks:
+            yield i, j, evaluate_pairing(units, i, j, engine, seed)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(tasks) / (workers * CHUNKS_PER_WORKER)))
+    chunks = [tasks[k : k + chunksize] for k in range(0, len(tasks), chunksize)]
+    definitions = [unit.get_definition() for unit in units]
+
+    if executor is not None:
+        # A shared pool was not started with this roster, so every chunk
+        # carries the definitions of the units it needs
+        futures = [
+            executor.submit(
+                _evaluate_definitions_chunk,
+                {k: definitions[k] for pairing in chunk for k in pairing},
+                chunk,
+                engine,
+                seed,
+            )
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(definitions,)
+    ) as executor:
+        futures = [
+            executor.submit(_evaluate_chunk, chunk, engine, seed) for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def _init_worker(definitions: list[dict]) -> None:
+    global _worker_units
+    _worker_units = [Unit.from_json(definition) for definition in definitions]
+
+
+def _evaluate_chunk(
+    chunk: list[tuple[int, int]], engine: str, seed: Optional[int]
+) -> list[tuple[int, int, MatchupResult]]:
+    return [
+        (i, j, evaluate_pairing(_worker_units, i, j, engine, seed)) for i, j in chunk
+    ]
+
+
+def _evaluate_definitions_chunk(
+    definitions: dict[int, dict],
+    chunk: list[tuple[int, int]],
+    engine: str,
+    seed: Optional[int],
+) -> list[tuple[int, int, MatchupResult]]:
+    units = {k: Unit.from_json(definition) for k, definition in definitions.items()}
+    return [
+        (i, j, evaluate_matchup(units[i], units[j], engine, pairing_roller(seed, i, j)))
+        for i, j in chunk
+    ]
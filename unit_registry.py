@@ -0,0 +1,95 @@
+"""This module contains the UnitRegistry class, a process-wide index of the units
+defined in a roster file."""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional
+
+from combatants.unit import Unit
+from roster_loader import load_roster
+
+logger = logging.getLogger(__name__)
+
+
+class UnitRegistry:
+    """Units of a roster file indexed by name.
+
+    The roster is parsed once on construction. refresh() re-parses it only
+    when the file's modification time or size changed and its content hash
+    differs, and swaps the whole index in one assignment, so readers always
+    see either the old or the new roster."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._stamp: Optional[tuple[int, int]] = None
+        self._digest: Optional[str] = None
+        self._units: dict[str, Unit] = {}
+        self.version = 0
+        self.reload()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def digest(self) -> Optional[str]:
+        """SHA-256 of the roster file the current units were parsed from."""
+        return self._digest
+
+    def get(self, name: str) -> Optional[Unit]:
+        return self._units.get(name)
+
+    def names(self) -> list[str]:
+        return list(self._units)
+
+    def units(self) -> list[Unit]:
+        return list(self._units.values())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._units
+
+    def __len__(self) -> int:
+        return len(self._units)
+
+    def refresh(self) -> bool:
+        """Reload the roster if the file changed since it was last read.
+
+        A roster that fails to parse is logged and the previous units are kept."""
+        try:
+            stamp = self._stat()
+        except OSError:
+            logger.exception("Could not stat roster %s", self._path)
+            return False
+        if stamp == self._stamp:
+            return False
+        try:
+            return self.reload()
+        except Exception:
+            logger.exception("Keeping previous roster, %s failed to load", self._path)
+            return False
+
+    def reload(self) -> bool:
+        """Read the roster file and rebuild the index if its content changed."""
+        with self._lock:
+            stamp = self._stat()
+            with open(self._path, "rb") as file:
+                raw = file.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if digest == self._digest:
+                self._stamp = stamp
+                return False
+
+            units = {unit.get_name(): unit for unit in load_roster(raw)}
+
+            self._units = units
+            self._digest = digest
+            self._stamp = stamp
+            self.version += 1
+            return True
+
+    def _stat(self) -> tuple[int, int]:
+        stat = os.stat(self._path)
+        return stat.st_mtime_ns, stat.st_size